@@ -1,9 +1,8 @@
 
 import csv
-import random
 
-def generate_qr_code():
-    return str(random.randint(10000, 99999))
+from db import get_connection
+from tickets import allocate_ticket_numbers
 
 new_entries = [
     {
@@ -17,7 +16,7 @@ new_entries = [
         'email': 'kayliewillis@lowndes.k12.ga.us',
         'status': 'Invited',
         'school_cleaned': '',
-        'qr_code': generate_qr_code(),
+        'qr_code': None,
         'attendance_response': '',
         'year': 2026
     },
@@ -32,7 +31,7 @@ new_entries = [
         'email': 'tenryberry@lowndes.k12.ga.us',
         'status': 'Invited',
         'school_cleaned': '',
-        'qr_code': generate_qr_code(),
+        'qr_code': None,
         'attendance_response': '',
         'year': 2026
     },
@@ -47,7 +46,7 @@ new_entries = [
         'email': 'amberhiers@lowndes.k12.ga.us',
         'status': 'Invited',
         'school_cleaned': '',
-        'qr_code': generate_qr_code(),
+        'qr_code': None,
         'attendance_response': '',
         'year': 2026
     },
@@ -62,12 +61,20 @@ new_entries = [
         'email': 'porchiaseawright@lowndes.k12.ga.us',
         'status': 'Invited',
         'school_cleaned': '',
-        'qr_code': generate_qr_code(),
+        'qr_code': None,
         'attendance_response': '',
         'year': 2026
     }
 ]
 
+# Reserve codes from the shared ticket sequence so they can't clash with
+# any attendee or sponsor ticket, including ones handed out later
+with get_connection() as conn, conn.cursor() as cur:
+    codes = allocate_ticket_numbers(cur, len(new_entries), 2026)
+    conn.commit()
+for entry, code in zip(new_entries, codes):
+    entry['qr_code'] = code
+
 # Append new entries to the CSV file
 with open('tad.csv', 'a', newline='') as file:
     writer = csv.DictWriter(file, fieldnames=[
@@ -3,74 +3,150 @@ from streamlit_qrcode_scanner import qrcode_scanner
 import os
 from datetime import datetime
 import time
-import psycopg2
 import pandas as pd
+from db import get_connection
+from attendees import (
+    CHECK_IN_FILTERS, CURRENT_YEAR, DASHBOARD_SCHOOL_SYSTEMS, PAGE_COLUMNS,
+    add_plus_ones, get_attendance_stats, get_attendee_page,
+    get_plus_one_candidates,
+)
+from migrations import ensure_schema
+from roster import get_roster
+from search import SEARCH_COLUMNS, SEARCH_LIMIT, search_attendees, search_roster
+from fuzzy import fuzzy_search, get_fuzzy_index
+from importer import REQUIRED_COLUMNS, bulk_import, prepare_import_frame
+from live import apply_checkin_events, get_checkin_feed
+from offline import CONNECTION_ERRORS, get_station
+from scan_session import ScanSession
+from scan_cards import attendee_from_entry, banner_html, get_scan_cards, notice_html, scan_card
+
+# How often the Attendee List dashboard picks up new check-ins
+LIVE_REFRESH_SECONDS = 3
+# Re-read the totals from the database now and then to correct any drift
+LIVE_RESYNC_SECONDS = 120
+LIVE_RECENT_ARRIVALS = 8
 
 def get_attendee_info(code):
+    station = get_station()
+    entry = None
+    if station.online:
+        try:
+            # The roster may refresh itself here, so bound it like the check-in
+            entry = station.run_online(lambda: get_roster(CURRENT_YEAR).get(code))
+        except CONNECTION_ERRORS:
+            pass
+    if not station.online:
+        # Keep scanning from this station's snapshot until the database is back
+        entry = station.lookup(code, CURRENT_YEAR)
+
+    if entry:
+        return attendee_from_entry(entry)
+    return None
+
+def check_in(code):
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-
-        # First check if the attendee exists and get their info
-        cur.execute("""
-            SELECT first_name, last_name, school_system, bringing_plus_one, toty, status, table_number
-            FROM attendees 
-            WHERE qr_code = %s
-        """, (code,))
-
-        result = cur.fetchone()
-
-        if result:
-            first_name, last_name, school_system, plus_one, toty, status, table_number = result
-
-            # First get current checked_in status without updating
-            cur.execute("SELECT checked_in FROM attendees WHERE qr_code = %s", (code,))
-            checked_in = cur.fetchone()[0]
-
-            info = {
-                'name': f"{first_name} {last_name}",
-                'school_system': school_system,
-                'plus_one': plus_one,
-                'checked_in': checked_in,
-                'toty': toty,
-                'status': status,
-                'table_number': table_number
-            }
-            return info
-        return None
-
+        # Unknown codes are answered from the roster cache without touching the database
+        if not get_attendee_info(code):
+            return None
+        attendee = get_station().check_in(code, CURRENT_YEAR)
     except Exception as e:
         st.error(f"Database error: {e}")
         return None
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+    # Offline check-ins reach the roster cache once they are replayed
+    if attendee and not attendee['offline']:
+        get_roster(CURRENT_YEAR).update(code, checked_in=attendee['checked_in'])
+    return attendee
+
+def _search_online(query):
+    results = search_attendees(query, CURRENT_YEAR)
+    if results:
+        return results, False
+    # Nothing spelled that way - fall back to the closest names
+    return fuzzy_search(query, CURRENT_YEAR), True
+
+def search_names(query):
+    """(results, fuzzy) for Name Search, without ever waiting on a dead database."""
+    station = get_station()
+    if station.online:
+        try:
+            return station.run_online(_search_online, query)
+        except CONNECTION_ERRORS:
+            pass
+    return search_roster(station.entries(CURRENT_YEAR), query), False
 
 def display_seating_banner(status, table_number):
-    if status in ['Admin', 'Administration']:
-        st.markdown("""
-            <div style="background-color: #28a745; color: white; padding: 15px; border-radius: 10px; text-align: center; font-size: 24px; font-weight: bold; margin-bottom: 15px;">
-                Admin Table
-            </div>
-        """, unsafe_allow_html=True)
-    elif status == 'Sponsor':
-        if table_number:
-            table_text = f"Sponsor Table #{table_number}"
+    st.markdown(banner_html(status, table_number), unsafe_allow_html=True)
+
+def render_scan_result(code, attendee):
+    # One pre-built block per scan, shared by the scanner and manual entry
+    card = scan_card(code, attendee)
+    st.markdown(card + notice_html(attendee), unsafe_allow_html=True)
+
+def sync_live_attendance(year, recent=()):
+    # Read the feed position first: a check-in landing during the query is
+    # then counted twice rather than missed, and the next resync fixes it.
+    state = {
+        'year': year,
+        'seq': get_checkin_feed().seq,
+        'stats': get_attendance_stats(year),
+        'recent': list(recent),
+        'synced_at': time.monotonic(),
+    }
+    st.session_state.live_attendance = state
+    return state
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_attendance(year):
+    feed = get_checkin_feed()
+    state = st.session_state.get('live_attendance')
+    try:
+        if (state is None or state['year'] != year
+                or time.monotonic() - state['synced_at'] > LIVE_RESYNC_SECONDS):
+            state = sync_live_attendance(year, state['recent'] if state and state['year'] == year else ())
+            events = []
         else:
-            table_text = "Sponsor Table"
-        st.markdown(f"""
-            <div style="background-color: #FFD700; color: black; padding: 15px; border-radius: 10px; text-align: center; font-size: 24px; font-weight: bold; margin-bottom: 15px;">
-                {table_text}
-            </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown("""
-            <div style="background-color: #6c757d; color: white; padding: 15px; border-radius: 10px; text-align: center; font-size: 24px; font-weight: bold; margin-bottom: 15px;">
-                General Open Seating
-            </div>
-        """, unsafe_allow_html=True)
+            events = feed.events_since(state['seq'])
+            if events is None:
+                # Fell too far behind the feed; start over from the database
+                state = sync_live_attendance(year, state['recent'])
+                events = []
+    except Exception as e:
+        st.error(f"Database error: {e}")
+        return
+
+    if events:
+        apply_checkin_events(state['stats'], events, year)
+        state['seq'] = events[-1]['seq']
+        for event in events:
+            if event['year'] != year:
+                continue
+            name = ' '.join(part for part in (event['first_name'], event['last_name']) if part)
+            if event['previous'] == 0:
+                state['recent'].insert(0, f"{name} ({event['school_system']})")
+            elif event['checked_in'] == 2:
+                state['recent'].insert(0, f"+1 for {name}")
+        del state['recent'][LIVE_RECENT_ARRIVALS:]
+
+    stats = state['stats']
+
+    # Display statistics
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Total Registered", stats['total_registered'])
+    with col2:
+        st.metric("Total Checked In", stats['total_checked_in'])
+
+    # Display school system breakdown including plus ones
+    st.write("### Current Attendance by School System")
+    for school, count in stats['by_school_system'].items():
+        st.write(f"{school}: {count}")
+
+    if state['recent']:
+        st.write("### Recent Arrivals")
+        for arrival in state['recent']:
+            st.write(arrival)
+    if not feed.connected:
+        st.caption("Live updates paused - reconnecting to the database...")
 
 # Get password from environment variables
 my_secret = os.environ['password']
@@ -119,47 +195,44 @@ if not st.session_state.authenticated:
 else:
     st.title("Event Check-in System")
 
+    # All no-ops after the first run in this process. While offline the
+    # sync thread is the only thing that talks to the database.
+    station = get_station()
+    if station.online:
+        try:
+            ensure_schema()
+            get_roster(CURRENT_YEAR)
+            get_fuzzy_index(CURRENT_YEAR)
+            get_scan_cards(CURRENT_YEAR)
+        except CONNECTION_ERRORS:
+            station.mark_offline()
+        except Exception as e:
+            st.error(f"Database error: {e}")
+    if station.last_error is not None:
+        st.error(f"Offline sync failed: {station.last_error}")
+
     tab1, tab2, tab3 = st.tabs(["📷 Check-in", "📋 Attendee List", "📥 Import Attendees"])
 
     with tab1:
         st.header("Scan QR Code")
+
+        pending = station.pending_count()
+        if not station.online:
+            st.warning(f"📴 Offline mode: check-ins are saved on this station and will sync "
+                       f"when the database is reachable again ({pending} waiting).")
+        elif pending:
+            st.info(f"🔄 Syncing {pending} offline check-in(s)...")
         
             
         qr_code = qrcode_scanner(key='scanner')
 
         if qr_code:
-            attendee = get_attendee_info(qr_code)
+            # One check-in per physical scan, however often the page reruns
+            if 'scan_session' not in st.session_state:
+                st.session_state.scan_session = ScanSession()
+            attendee, _ = st.session_state.scan_session.process(qr_code, check_in)
             if attendee:
-                display_seating_banner(attendee['status'], attendee['table_number'])
-                st.write(f"**Name:** {attendee['name']}")
-                st.write(f"**School System:** {attendee['school_system']}")
-                st.write(f"**Type:** {attendee['status']}")
-                st.write(f"**Bringing Plus One:** {'Yes' if attendee['plus_one'] else 'No'}")
-                if attendee['toty'] == 1:
-                    st.markdown(":green[Teacher of the Year!]")
-                elif attendee['toty'] == 2:
-                    st.markdown(":green[Staff of the Year!]")
-                elif attendee['toty'] == 3:
-                    st.markdown(":green[Superintendent!]")
-                if attendee['checked_in'] != 0:
-                    st.warning("Already checked in")
-                try:
-                    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-                    cur = conn.cursor()
-                    check_in_value = 2 if attendee['toty'] != 0 else 1
-                    cur.execute("""
-                        UPDATE attendees 
-                        SET checked_in = %s
-                        WHERE qr_code = %s
-                    """, (check_in_value, qr_code))
-                    conn.commit()
-                except Exception as e:
-                    st.error(f"Error updating status: {e}")
-                finally:
-                    if cur:
-                        cur.close()
-                    if conn:
-                        conn.close()
+                render_scan_result(qr_code, attendee)
             else:
                 st.error("Attendee not found")
 
@@ -176,39 +249,9 @@ else:
                                                 type="primary")
 
         if submit_button and qr_code:
-            attendee = get_attendee_info(qr_code)
+            attendee = check_in(qr_code)
             if attendee:
-                display_seating_banner(attendee['status'], attendee['table_number'])
-                st.write(f"**Name:** {attendee['name']}")
-                st.write(f"**School System:** {attendee['school_system']}")
-                st.write(f"**Type:** {attendee['status']}")
-                st.write(f"**Bringing Plus One:** {'Yes' if attendee['plus_one'] else 'No'}")
-                if attendee['toty'] == 1:
-                    st.markdown(":green[Teacher of the Year!]")
-                elif attendee['toty'] == 2:
-                    st.markdown(":green[Staff of the Year!]")
-                elif attendee['toty'] == 3:
-                    st.markdown(":green[Superintendent!]")
-                if attendee['checked_in'] != 0:
-                    st.warning("Already checked in")
-                try:
-                    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-                    cur = conn.cursor()
-                    check_in_value = 2 if attendee['toty'] != 0 else 1
-                    cur.execute("""
-                        UPDATE attendees 
-                        SET checked_in = %s
-                        WHERE qr_code = %s
-                    """, (check_in_value, qr_code))
-                    conn.commit()
-                    st.write(f"{attendee['name']} checked in successfully!")
-                except Exception as e:
-                    st.error(f"Error updating status: {e}")
-                finally:
-                    if cur:
-                        cur.close()
-                    if conn:
-                        conn.close()
+                render_scan_result(qr_code, attendee)
             else:
                 st.error("Attendee not found")
         
@@ -219,23 +262,15 @@ else:
 
         if search_query:
             try:
-                conn = psycopg2.connect(os.environ['DATABASE_URL'])
-                cur = conn.cursor()
-
-                # Search for matching names
-                cur.execute("""
-                    SELECT qr_code, first_name, last_name, school_system, status, checked_in, toty, table_number
-                    FROM attendees 
-                    WHERE LOWER(first_name) LIKE LOWER(%s) 
-                    OR LOWER(last_name) LIKE LOWER(%s)
-                    ORDER BY last_name, first_name
-                """, (f'%{search_query}%', f'%{search_query}%'))
-
-                results = cur.fetchall()
+                results, fuzzy = search_names(search_query)
+                if results and fuzzy:
+                    st.info("No exact matches. Did you mean one of these?")
 
                 if results:
                     for result in results:
-                        qr_code, first_name, last_name, school_system, status, checked_in, toty, table_number = result
+                        qr_code, first_name, last_name, school_system, status, checked_in, toty, table_number = (
+                            result[c] for c in SEARCH_COLUMNS
+                        )
                         
                         # Show seating banner if already checked in
                         if checked_in > 0:
@@ -254,34 +289,21 @@ else:
                                 st.markdown(":green[Superintendent!]")
                         with col2:
                             if checked_in == 0:
-                                check_in_value = 0
                                 if st.button("Check In", key=f"search_{qr_code}", type="primary"):
-                                    if toty in [1, 2, 3]:
-                                        check_in_value = 2
-                                    else:
-                                        check_in_value = 1
-                                    cur.execute("""
-                                        UPDATE attendees 
-                                        SET checked_in = %s 
-                                        WHERE qr_code = %s
-                                    """, (check_in_value,qr_code))
-                                    conn.commit()
+                                    check_in(qr_code)
                                     # Show seating banner after check-in
                                     display_seating_banner(status, table_number)
                                     st.rerun()
                             else:
                                 st.write("Already checked in")
                         st.markdown("---")
+                    if len(results) == SEARCH_LIMIT:
+                        st.caption(f"Showing the first {SEARCH_LIMIT} matches - type more of the name to narrow it down.")
                 else:
                     st.warning("No matching names found")
 
             except Exception as e:
                 st.error(f"Error searching database: {e}")
-            finally:
-                if cur:
-                    cur.close()
-                if conn:
-                    conn.close()
 
     def sync_from_csv():
         try:
@@ -293,68 +315,45 @@ else:
                 # Read CSV
                 df = pd.read_csv(uploaded_file)
 
-                # Connect to PostgreSQL
-                db_url = os.environ['DATABASE_URL']
-                print(db_url)
-                conn = psycopg2.connect(db_url)
-                cur = conn.cursor()
-
-                # Create table if not exists
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS tad_attendees (
-                        prefix TEXT,
-                        first_name TEXT,
-                        last_name TEXT,
-                        suffix TEXT,
-                        system TEXT,
-                        grade TEXT,
-                        plus_one BOOLEAN,
-                        email TEXT,
-                        status TEXT,
-                        school TEXT,
-                        id TEXT PRIMARY KEY
-                    )
-                """)
-
-                # Insert data
-                for _, row in df.iterrows():
-                    cur.execute("""
-                        INSERT INTO tad_attendees 
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (id) 
-                        DO UPDATE SET 
-                            prefix = EXCLUDED.prefix,
-                            first_name = EXCLUDED.first_name,
-                            last_name = EXCLUDED.last_name,
-                            suffix = EXCLUDED.suffix,
-                            system = EXCLUDED.system,
-                            grade = EXCLUDED.grade,
-                            plus_one = EXCLUDED.plus_one,
-                            email = EXCLUDED.email,
-                            status = EXCLUDED.status,
-                            school = EXCLUDED.school
-                    """, (
-                        row['Timestamp'],
-                        row['Preferred Prefix (optional):'],
-                        row['First Name'],
-                        row['Last Name'],
-                        row['Suffix (e.g. Jr., III)'],
-                        row['School System'],
-                        row['School Name'],
-                        row['Grade / Subject (e.g. 3rd Grade / 10th Grade Math)'],
-                        row['Bringing Plus One?'] == 'Yes',
-                        row['Preferred Contact Email'],
-                        row['Status'],
-                        row['School Cleaned'],
-                        row['ID'],
-                        row['qrCode'],
-                        row['Attendance Response'],
-                        False
-                    ))
-
-                conn.commit()
-                cur.close()
-                conn.close()
+                # tad_attendees is created by migration 4
+                with get_connection() as conn, conn.cursor() as cur:
+                    # Insert data
+                    for _, row in df.iterrows():
+                        cur.execute("""
+                            INSERT INTO tad_attendees 
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                            ON CONFLICT (id) 
+                            DO UPDATE SET 
+                                prefix = EXCLUDED.prefix,
+                                first_name = EXCLUDED.first_name,
+                                last_name = EXCLUDED.last_name,
+                                suffix = EXCLUDED.suffix,
+                                system = EXCLUDED.system,
+                                grade = EXCLUDED.grade,
+                                plus_one = EXCLUDED.plus_one,
+                                email = EXCLUDED.email,
+                                status = EXCLUDED.status,
+                                school = EXCLUDED.school
+                        """, (
+                            row['Timestamp'],
+                            row['Preferred Prefix (optional):'],
+                            row['First Name'],
+                            row['Last Name'],
+                            row['Suffix (e.g. Jr., III)'],
+                            row['School System'],
+                            row['School Name'],
+                            row['Grade / Subject (e.g. 3rd Grade / 10th Grade Math)'],
+                            row['Bringing Plus One?'] == 'Yes',
+                            row['Preferred Contact Email'],
+                            row['Status'],
+                            row['School Cleaned'],
+                            row['ID'],
+                            row['qrCode'],
+                            row['Attendance Response'],
+                            False
+                        ))
+
+                    conn.commit()
 
                 # Update session state
                 st.session_state.attendees = [
@@ -374,117 +373,119 @@ else:
     with tab2:
         st.header("Attendee List")
 
-        # Query and display attendees from database
-        conn = None
-        cur = None
-        try:
-            conn = psycopg2.connect(os.environ['DATABASE_URL'])
-            cur = conn.cursor()
-
-            # Get available years for the dropdown
-            cur.execute("SELECT DISTINCT year FROM attendees ORDER BY year DESC")
-            available_years = [row[0] for row in cur.fetchall()]
+        if not station.online:
+            st.warning("📴 The attendee list needs the database. It will be back once the "
+                       "database is reachable again.")
+        else:
+            # Query and display attendees from database
+            try:
+                with get_connection() as conn, conn.cursor() as cur:
+                    # Get available years for the dropdown
+                    cur.execute("SELECT DISTINCT year FROM attendees ORDER BY year DESC")
+                    available_years = [row[0] for row in cur.fetchall()]
             
-            # Year selector
-            selected_year = st.selectbox("Select Year", available_years, index=0 if available_years else None)
-
-            cur.execute("""
-                SELECT first_name, last_name, school_system, bringing_plus_one, checked_in, toty
-                FROM attendees
-                WHERE year = %s
-                ORDER BY last_name, first_name
-            """, (selected_year,))
-
-            attendees = cur.fetchall()
-
-            # Convert to dataframe for display
-            cur.execute("""
-                SELECT first_name, last_name, school_system, bringing_plus_one, checked_in, toty, qr_code, table_number
-                FROM attendees
-                WHERE year = %s
-                ORDER BY last_name, first_name
-            """, (selected_year,))
-            attendees = cur.fetchall()
-
-            df = pd.DataFrame(attendees, 
-                            columns=['First Name', 'Last Name', 'School System', 'Plus One', 'Checked In', 'TOTY', 'QR Code', 'Table'])
-
-            # Create status column based on checked_in value
-            df['Status'] = df['Checked In'].map({
-                0: "❌ Not Checked In",
-                1: "✅ Checked In",
-                2: "✅ Checked In with Plus One"
-            })
-
-            #Create TOTY column
-            df['TOTY'] = df['TOTY'].map({
-                1: "Teacher of the Year",
-                2: "Staff of the Year",
-                3: "Superintendent",
-                None: ""
-            })
-
-            # Calculate statistics
-            total_registered = len(df)
-            total_checked_in = df['Checked In'].apply(lambda x: 2 if x == 2 else (1 if x == 1 else 0)).sum()
-
-            # Display statistics
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Total Registered", total_registered)
-            with col2:
-                st.metric("Total Checked In", total_checked_in)
-
-            # Calculate attendance by school system including plus ones
-            school_attendance = df.groupby('School System')['Checked In'].apply(
-                lambda x: (x == 2).sum() * 2 + (x == 1).sum()
-            ).reindex(['Lowndes County Schools', 'Valdosta City Schools']).fillna(0).astype(int)
-
-            # Display school system breakdown
-            st.write("### Current Attendance by School System")
-            for school, count in school_attendance.items():
-                st.write(f"{school}: {count}")
-
-            # Display the dataframe with increased width
-            st.dataframe(df, width=1200)
-
-            clear_col1, clear_col2 = st.columns([1, 3])
-
-            # Add Plus One links for eligible attendees
-            st.write("### Plus One Check-in")
-            for idx, row in df.iterrows():
-                if row['Plus One'] and row['Checked In'] == 1:
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.markdown(f"[**:green[+ One for {row['First Name']} {row['Last Name']}]**](#plus_one_{idx})", unsafe_allow_html=True):
-                            try:
-                                conn = psycopg2.connect(os.environ['DATABASE_URL'])
-                                cur = conn.cursor()
-                                cur.execute("""
-                                    UPDATE attendees 
-                                    SET checked_in = 2 
-                                    WHERE first_name = %s AND last_name = %s AND year = %s
-                                """, (row['First Name'], row['Last Name'], selected_year))
-                                conn.commit()
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Error updating plus one status: {e}")
-                            finally:
-                                if cur:
-                                    cur.close()
-                                if conn:
-                                    conn.close()
-                    with col2:
-                        if row['Checked In'] == 2:
-                            st.write(":green[(+1 added)]")
+                # Year selector
+                selected_year = st.selectbox("Select Year", available_years, index=0 if available_years else None)
+
+                live_attendance(selected_year)
+
+                # Filters
+                filter_col1, filter_col2, filter_col3, filter_col4 = st.columns([2, 2, 2, 1])
+                with filter_col1:
+                    name_filter = st.text_input("Last name starts with", key="list_name_filter")
+                with filter_col2:
+                    school_filter = st.selectbox("School System", ["All"] + DASHBOARD_SCHOOL_SYSTEMS, key="list_school_filter")
+                with filter_col3:
+                    check_in_filter = st.selectbox("Check-in Status", list(CHECK_IN_FILTERS), key="list_check_in_filter")
+                with filter_col4:
+                    page_size = st.selectbox("Rows", [25, 50, 100, 200], index=1, key="list_page_size")
+
+                # Only the visible page is fetched. Keep the cursor each page
+                # started from so Previous doesn't have to re-scan, and start
+                # over whenever the year or a filter changes.
+                list_key = (selected_year, name_filter, school_filter, check_in_filter, page_size)
+                if st.session_state.get('list_key') != list_key:
+                    st.session_state.list_key = list_key
+                    st.session_state.list_cursors = [None]
+                cursors = st.session_state.list_cursors
+
+                rows, next_cursor = get_attendee_page(
+                    selected_year,
+                    after=cursors[-1],
+                    limit=page_size,
+                    school_system=None if school_filter == "All" else school_filter,
+                    check_in=check_in_filter,
+                    last_name_prefix=name_filter,
+                )
+
+                df = pd.DataFrame(rows, columns=PAGE_COLUMNS)
+                df.columns = ['First Name', 'Last Name', 'School System', 'Plus One', 'Checked In', 'TOTY', 'QR Code', 'Table']
+
+                # Create status column based on checked_in value
+                df['Status'] = df['Checked In'].map({
+                    0: "❌ Not Checked In",
+                    1: "✅ Checked In",
+                    2: "✅ Checked In with Plus One"
+                })
+
+                #Create TOTY column
+                df['TOTY'] = df['TOTY'].map({
+                    1: "Teacher of the Year",
+                    2: "Staff of the Year",
+                    3: "Superintendent",
+                    None: ""
+                })
+
+                # Display the dataframe with increased width
+                st.dataframe(df, width=1200, hide_index=True)
+
+                page = len(cursors)
+                first_row = (page - 1) * page_size + 1
+                nav_col1, nav_col2, nav_col3 = st.columns([1, 3, 1])
+                with nav_col1:
+                    if st.button("◀ Previous", disabled=page == 1, key="list_prev"):
+                        cursors.pop()
+                        st.rerun()
+                with nav_col2:
+                    if rows:
+                        st.caption(f"Page {page} · rows {first_row}–{first_row + len(rows) - 1}")
+                    else:
+                        st.caption("No attendees match these filters")
+                with nav_col3:
+                    if st.button("Next ▶", disabled=next_cursor is None, key="list_next"):
+                        cursors.append(next_cursor)
+                        st.rerun()
+
+                # Plus ones arriving after their attendee, applied in one batch
+                st.write("### Plus One Check-in")
+                candidates = get_plus_one_candidates(selected_year)
+                if candidates:
+                    labels = {c['qr_code']: f"{c['name']} ({c['school_system'] or 'N/A'})" for c in candidates}
+                    selected_codes = st.multiselect(
+                        "Attendees whose plus one has arrived",
+                        list(labels),
+                        format_func=labels.get,
+                        key="plus_one_codes",
+                    )
+                    if st.button("Check In Plus Ones", disabled=not selected_codes):
+                        try:
+                            updated = add_plus_ones(selected_codes, selected_year)
+                            if selected_year == CURRENT_YEAR:
+                                roster = get_roster(CURRENT_YEAR)
+                                for code in updated:
+                                    roster.update(code, checked_in=2)
+                            del st.session_state.plus_one_codes
+                            st.session_state.plus_one_message = f"Checked in {len(updated)} plus one(s)"
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"Error updating plus one status: {e}")
+                else:
+                    st.write("No checked-in attendees are waiting on a plus one.")
+                if 'plus_one_message' in st.session_state:
+                    st.success(st.session_state.pop('plus_one_message'))
 
-        except Exception as e:
-            st.error(f"Database error: {e}")
-        finally:
-            if cur:
-                cur.close()
-            if conn:
-                conn.close()
+            except Exception as e:
+                st.error(f"Database error: {e}")
 
     with tab3:
         st.header("Import Attendees from CSV")
@@ -502,79 +503,26 @@ else:
                 st.write("**Preview:**")
                 st.dataframe(df.head(10))
                 
-                expected_cols = ['Name', 'Email', 'Type', 'School System', 'ticket_id']
-                missing_cols = [col for col in expected_cols if col not in df.columns]
+                missing_cols = [col for col in REQUIRED_COLUMNS if col not in df.columns]
                 
                 if missing_cols:
                     st.error(f"Missing columns: {', '.join(missing_cols)}")
                 else:
-                    st.write(f"**Total rows:** {len(df)}")
+                    prepared, row_errors = prepare_import_frame(df)
+                    st.write(f"**Total rows:** {len(df)} ({len(prepared)} ready to import)")
+                    if row_errors:
+                        st.warning(f"{len(row_errors)} rows have problems and will be skipped:")
+                        st.dataframe(pd.DataFrame(row_errors, columns=['CSV Line', 'Name', 'Problem']))
                     
-                    if st.button("Import Attendees", type="primary"):
+                    if st.button("Import Attendees", type="primary", disabled=prepared.empty):
                         try:
-                            conn = psycopg2.connect(os.environ['DATABASE_URL'])
-                            cur = conn.cursor()
-                            
-                            success_count = 0
-                            error_count = 0
-                            
-                            for _, row in df.iterrows():
-                                try:
-                                    full_name = str(row['Name']).strip()
-                                    name_parts = full_name.split(' ', 1)
-                                    first_name = name_parts[0] if len(name_parts) > 0 else ''
-                                    last_name = name_parts[1] if len(name_parts) > 1 else ''
-                                    
-                                    email = str(row['Email']).strip() if pd.notna(row['Email']) else ''
-                                    attendee_type = str(row['Type']).strip() if pd.notna(row['Type']) else ''
-                                    school_system = str(row['School System']).strip() if pd.notna(row['School System']) else 'N/A'
-                                    ticket_id = str(row['ticket_id']).strip() if pd.notna(row['ticket_id']) else ''
-                                    
-                                    table_number = None
-                                    if 'Table' in row and pd.notna(row['Table']):
-                                        try:
-                                            table_number = int(row['Table'])
-                                        except:
-                                            table_number = None
-                                    
-                                    toty_value = 0
-                                    if attendee_type == 'TOTY':
-                                        toty_value = 1
-                                    
-                                    status = attendee_type
-                                    
-                                    cur.execute("SELECT qr_code FROM attendees WHERE qr_code = %s", (ticket_id,))
-                                    existing = cur.fetchone()
-                                    
-                                    if existing:
-                                        cur.execute("""
-                                            UPDATE attendees 
-                                            SET first_name = %s, last_name = %s, email = %s, status = %s, 
-                                                school_system = %s, toty = %s, table_number = %s
-                                            WHERE qr_code = %s
-                                        """, (first_name, last_name, email, status, school_system, toty_value, table_number, ticket_id))
-                                    else:
-                                        cur.execute("""
-                                            INSERT INTO attendees (first_name, last_name, email, status, school_system, qr_code, checked_in, toty, year, table_number)
-                                            VALUES (%s, %s, %s, %s, %s, %s, 0, %s, 2026, %s)
-                                        """, (first_name, last_name, email, status, school_system, ticket_id, toty_value, table_number))
-                                    success_count += 1
-                                except Exception as row_error:
-                                    conn.rollback()
-                                    error_count += 1
-                                    st.warning(f"Error importing row: {row['Name']} - {row_error}")
-                            
-                            conn.commit()
-                            st.success(f"Imported {success_count} attendees successfully!")
-                            if error_count > 0:
-                                st.warning(f"{error_count} rows had errors")
-                                
+                            inserted, updated = bulk_import(prepared, CURRENT_YEAR)
+                            get_roster(CURRENT_YEAR).load()
+                            st.success(f"Imported {inserted + updated} attendees successfully! "
+                                       f"({inserted} new, {updated} updated)")
+                            if row_errors:
+                                st.warning(f"{len(row_errors)} rows had errors")
                         except Exception as e:
                             st.error(f"Database error: {e}")
-                        finally:
-                            if cur:
-                                cur.close()
-                            if conn:
-                                conn.close()
             except Exception as e:
                 st.error(f"Error reading CSV: {e}")
\ No newline at end of file
@@ -0,0 +1,213 @@
+from db import get_connection
+
+CURRENT_YEAR = 2026
+
+TOTY_LABELS = {
+    1: "Teacher of the Year!",
+    2: "Staff of the Year!",
+    3: "Superintendent!",
+}
+
+
+def check_in_attendee(code, year=CURRENT_YEAR):
+    """Atomically check an attendee in and report what changed.
+
+    The row is locked, read and updated in a single statement, so two
+    scanners reading the same badge cannot both see it as not checked in.
+    TOTY honorees are checked in with their plus one; an existing check-in
+    (including a plus one added later) is never downgraded.
+
+    Returns None when the code is unknown, otherwise the attendee info with
+    both the previous and the new ``checked_in`` values.
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            WITH prev AS (
+                SELECT qr_code, checked_in
+                FROM attendees
+                WHERE qr_code = %s AND year = %s
+                FOR UPDATE
+            )
+            UPDATE attendees a
+            SET checked_in = GREATEST(
+                COALESCE(prev.checked_in, 0),
+                CASE WHEN COALESCE(a.toty, 0) <> 0 THEN 2 ELSE 1 END
+            )
+            FROM prev
+            WHERE a.qr_code = prev.qr_code AND a.year = %s
+            RETURNING a.first_name, a.last_name, a.school_system, a.bringing_plus_one,
+                      a.toty, a.status, a.table_number, COALESCE(prev.checked_in, 0), a.checked_in
+        """, (code, year, year))
+        result = cur.fetchone()
+        if not result:
+            # Sponsor tickets are checked in where they live (see the
+            # ticket_holders view), with the same locking
+            cur.execute("""
+                WITH prev AS (
+                    SELECT id, checked_in
+                    FROM sponsor_tickets
+                    WHERE ticket_number = %s AND year = %s
+                    FOR UPDATE
+                )
+                UPDATE sponsor_tickets t
+                SET checked_in = GREATEST(COALESCE(prev.checked_in, 0), 1)
+                FROM prev, sponsors s
+                WHERE t.id = prev.id AND s.id = t.sponsor_id
+                RETURNING COALESCE(NULLIF(t.recipient_name, ''), s.company_name || ' Guest'), '',
+                          'N/A', false, 0, 'Sponsor', t.table_number,
+                          COALESCE(prev.checked_in, 0), t.checked_in
+            """, (code, year))
+            result = cur.fetchone()
+        conn.commit()
+
+    if not result:
+        return None
+
+    (first_name, last_name, school_system, plus_one, toty, status,
+     table_number, previous_checked_in, checked_in) = result
+    return {
+        'name': ' '.join(part for part in (first_name, last_name) if part),
+        'school_system': school_system,
+        'plus_one': plus_one,
+        'toty': toty,
+        'status': status,
+        'table_number': table_number,
+        'previous_checked_in': previous_checked_in,
+        'checked_in': checked_in,
+    }
+
+
+def get_plus_one_candidates(year):
+    """Ticket holders checked in alone who registered a plus one, by name."""
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT qr_code, first_name, last_name, school_system
+            FROM ticket_holders
+            WHERE year = %s AND checked_in = 1 AND bringing_plus_one
+            ORDER BY last_name, first_name
+        """, (year,))
+        return [
+            {'qr_code': code, 'name': ' '.join(part for part in (first_name, last_name) if part),
+             'school_system': school_system}
+            for code, first_name, last_name, school_system in cur.fetchall()
+        ]
+
+
+def add_plus_ones(codes, year=CURRENT_YEAR):
+    """Mark the plus ones of several checked-in attendees as arrived.
+
+    One statement keyed by (year, qr_code). Attendees who are not checked in
+    or already have their plus one are left alone. Returns the codes that
+    were updated.
+    """
+    codes = [str(code) for code in codes]
+    if not codes:
+        return []
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE attendees
+            SET checked_in = 2
+            WHERE year = %s AND qr_code = ANY(%s) AND checked_in = 1
+            RETURNING qr_code
+        """, (year, codes))
+        updated = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    return updated
+
+
+# School systems always shown on the dashboard, even before anyone arrives
+DASHBOARD_SCHOOL_SYSTEMS = ['Lowndes County Schools', 'Valdosta City Schools']
+
+
+def get_attendance_stats(year):
+    """Registration and headcount totals for a year, in one aggregate query.
+
+    Sponsor guests are included (see the ticket_holders view). Headcount
+    counts a check-in with a plus one as two people. Returns
+    total_registered, total_checked_in and by_school_system (headcount per
+    school system, always including DASHBOARD_SCHOOL_SYSTEMS).
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT GROUPING(school_system) = 1 AS is_total,
+                   school_system,
+                   count(*),
+                   COALESCE(sum(CASE checked_in WHEN 2 THEN 2 WHEN 1 THEN 1 ELSE 0 END), 0)
+            FROM ticket_holders
+            WHERE year = %s
+            GROUP BY ROLLUP (school_system)
+        """, (year,))
+        rows = cur.fetchall()
+
+    stats = {
+        'total_registered': 0,
+        'total_checked_in': 0,
+        'by_school_system': {school: 0 for school in DASHBOARD_SCHOOL_SYSTEMS},
+    }
+    for is_total, school_system, registered, headcount in rows:
+        if is_total:
+            stats['total_registered'] = registered
+            stats['total_checked_in'] = headcount
+        elif school_system in stats['by_school_system']:
+            stats['by_school_system'][school_system] = headcount
+    return stats
+
+
+ATTENDEE_PAGE_SIZE = 50
+
+PAGE_COLUMNS = [
+    'first_name', 'last_name', 'school_system', 'bringing_plus_one',
+    'checked_in', 'toty', 'qr_code', 'table_number',
+]
+
+CHECK_IN_FILTERS = {
+    'All': None,
+    'Not Checked In': "checked_in = 0",
+    'Checked In': "checked_in > 0",
+    'Checked In with Plus One': "checked_in = 2",
+}
+
+# Must match the index from migration 6 (the attendees side of ticket_holders)
+_SORT_KEY = "(COALESCE(last_name, ''), COALESCE(first_name, ''), COALESCE(qr_code, ''))"
+
+
+def get_attendee_page(year, after=None, limit=ATTENDEE_PAGE_SIZE,
+                      school_system=None, check_in='All', last_name_prefix=''):
+    """One page of a year's ticket holders, ordered by last name, first name, code.
+
+    after is the cursor returned with the previous page, so each page is a
+    single index range scan no matter how deep into the list it is.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    conditions = ["year = %s"]
+    params = [year]
+    if after is not None:
+        conditions.append(f"{_SORT_KEY} > (%s, %s, %s)")
+        params.extend(after)
+    if school_system:
+        conditions.append("school_system = %s")
+        params.append(school_system)
+    if CHECK_IN_FILTERS[check_in]:
+        conditions.append(CHECK_IN_FILTERS[check_in])
+    if last_name_prefix.strip():
+        conditions.append("lower(last_name) LIKE %s")
+        params.append(last_name_prefix.strip().lower().replace('\\', '\\\\')
+                      .replace('%', '\\%').replace('_', '\\_') + '%')
+
+    with get_connection() as conn, conn.cursor() as cur:
+        # Fetch one extra row to learn whether there is a next page
+        cur.execute(f"""
+            SELECT {', '.join(PAGE_COLUMNS)}
+            FROM ticket_holders
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {_SORT_KEY}
+            LIMIT %s
+        """, params + [limit + 1])
+        rows = [dict(zip(PAGE_COLUMNS, row)) for row in cur.fetchall()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = (last['last_name'] or '', last['first_name'] or '', last['qr_code'] or '')
+    return rows, next_cursor
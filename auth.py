@@ -0,0 +1,226 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from db import get_connection
+
+# Cost factor for new hashes; logins upgrade anything weaker (or plaintext)
+BCRYPT_ROUNDS = 12
+# bcrypt is meant to be slow, so only this many run at once in the process.
+# A burst of logins then queues here instead of starving every other session.
+BCRYPT_WORKERS = 2
+# Failed attempts allowed per username within the window before it is locked
+MAX_FAILED_LOGINS = 5
+FAILED_LOGIN_WINDOW_SECONDS = 15 * 60
+# Usernames with recent failures that are tracked at once; past this, expired
+# entries are swept and then the longest-idle ones dropped
+MAX_TRACKED_USERNAMES = 10000
+SESSION_TTL_SECONDS = 12 * 60 * 60
+# Tokens signed with a per-process secret simply stop verifying on restart
+SESSION_SECRET = os.environ.get('SESSION_SECRET') or secrets.token_hex(32)
+
+_hash_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+
+
+def hash_password(password):
+    return _hash_pool.submit(
+        lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+    ).result()
+
+
+def verify_password(password, hashed):
+    return _hash_pool.submit(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8')).result()
+
+
+def _hash_rounds(hashed):
+    # $2b$12$... - the cost is the third field
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def needs_rehash(stored):
+    return not stored.startswith('$2') or _hash_rounds(stored) < BCRYPT_ROUNDS
+
+
+_dummy_hash = None
+
+
+def _verify_nothing(password):
+    """Spend the same time as a real check, for usernames that don't exist."""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(16))
+    verify_password(password, _dummy_hash)
+
+
+class LoginThrottle:
+    """Per-username limit on failed logins, plus one check at a time per user.
+
+    After MAX_FAILED_LOGINS failures within FAILED_LOGIN_WINDOW_SECONDS the
+    username is locked until the oldest of them ages out. Concurrent attempts
+    for the same username are refused rather than queued, so nobody can tie
+    up the bcrypt workers by hammering one account. At most
+    MAX_TRACKED_USERNAMES usernames are tracked, so spraying made-up names
+    can't grow memory without bound.
+    """
+
+    def __init__(self):
+        self._failures = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def _recent(self, username, now):
+        failures = self._failures.get(username)
+        if failures is None:
+            return deque()
+        while failures and now - failures[0] > FAILED_LOGIN_WINDOW_SECONDS:
+            failures.popleft()
+        if not failures:
+            del self._failures[username]
+        return failures
+
+    def begin(self, username):
+        """Claim a login attempt. Returns seconds to wait, or 0 if allowed."""
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(username, now)
+            if len(failures) >= MAX_FAILED_LOGINS:
+                return int(FAILED_LOGIN_WINDOW_SECONDS - (now - failures[0])) + 1
+            if username in self._in_flight:
+                return 1
+            self._in_flight.add(username)
+            return 0
+
+    def end(self, username, success):
+        with self._lock:
+            self._in_flight.discard(username)
+            if success:
+                self._failures.pop(username, None)
+            else:
+                self._failures.setdefault(username, deque()).append(time.monotonic())
+                if len(self._failures) > MAX_TRACKED_USERNAMES:
+                    self._sweep()
+
+    def _sweep(self):
+        now = time.monotonic()
+        for username in list(self._failures):
+            self._recent(username, now)
+        excess = len(self._failures) - MAX_TRACKED_USERNAMES
+        if excess > 0:
+            idle = sorted(self._failures, key=lambda u: self._failures[u][-1])
+            for username in idle[:excess]:
+                del self._failures[username]
+
+
+_throttle = LoginThrottle()
+
+
+class LoginError(Exception):
+    pass
+
+
+def authenticate_sponsor(username, password, year):
+    """Check a sponsor's credentials. Returns the sponsor or None.
+
+    Raises LoginError when the username is temporarily locked. A password
+    stored in plaintext or with a weaker cost factor is rehashed once it
+    has been verified.
+    """
+    wait = _throttle.begin(username)
+    if wait:
+        raise LoginError(f"Too many login attempts. Please try again in {wait} seconds.")
+    success = False
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, company_name, sponsor_level, total_seats, year, password
+                FROM sponsors
+                WHERE username = %s AND year = %s
+            """, (username, year))
+            result = cur.fetchone()
+        if not result:
+            # Don't let the response time tell which usernames exist
+            _verify_nothing(password)
+            return None
+        stored_password = result[5]
+        if stored_password.startswith('$2'):
+            success = verify_password(password, stored_password)
+        else:
+            success = hmac.compare_digest(password.encode('utf-8'), stored_password.encode('utf-8'))
+        if not success:
+            return None
+        if needs_rehash(stored_password):
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("UPDATE sponsors SET password = %s WHERE id = %s AND password = %s",
+                            (hash_password(password), result[0], stored_password))
+                conn.commit()
+        return {
+            'id': result[0],
+            'company_name': result[1],
+            'sponsor_level': result[2],
+            'total_seats': result[3],
+            'year': result[4]
+        }
+    finally:
+        _throttle.end(username, success)
+
+
+def authenticate_admin(username, password, admin_username, admin_password):
+    """Check the admin credentials under the same throttle as sponsor logins.
+
+    Raises LoginError when the username is temporarily locked.
+    """
+    wait = _throttle.begin(username)
+    if wait:
+        raise LoginError(f"Too many login attempts. Please try again in {wait} seconds.")
+    success = False
+    try:
+        # Both comparisons always run, in constant time
+        username_ok = hmac.compare_digest(username.encode('utf-8'), admin_username.encode('utf-8'))
+        password_ok = hmac.compare_digest(password.encode('utf-8'), admin_password.encode('utf-8'))
+        success = username_ok and password_ok
+        return success
+    finally:
+        _throttle.end(username, success)
+
+
+def _sign(payload):
+    return hmac.new(SESSION_SECRET.encode('utf-8'), payload, hashlib.sha256).hexdigest()
+
+
+def issue_session_token(subject, data=None):
+    """Signed token for a logged-in session; subject is e.g. 'sponsor:12' or 'admin'."""
+    payload = base64.urlsafe_b64encode(json.dumps({
+        'sub': subject,
+        'exp': time.time() + SESSION_TTL_SECONDS,
+        'data': data,
+    }).encode('utf-8'))
+    return f"{payload.decode('ascii')}.{_sign(payload)}"
+
+
+def verify_session_token(token):
+    """The token's claims if it is genuine and unexpired, else None. No bcrypt involved."""
+    if not token or '.' not in token:
+        return None
+    payload, signature = token.rsplit('.', 1)
+    # Anything malformed or tampered with is simply not a valid token
+    try:
+        if not hmac.compare_digest(signature.encode('ascii'), _sign(payload.encode('ascii')).encode('ascii')):
+            return None
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        if claims['exp'] < time.time():
+            return None
+    except (UnicodeError, ValueError, TypeError, KeyError):
+        return None
+    return claims
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+# Pool sizing can be tuned per deployment without touching code
+POOL_MIN_CONN = int(os.environ.get('DB_POOL_MIN', 1))
+POOL_MAX_CONN = int(os.environ.get('DB_POOL_MAX', 10))
+# How long a checkout waits for a free connection before giving up
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Connections idle longer than this are pinged before being handed out
+HEALTH_CHECK_IDLE_SECONDS = 30
+# Fail fast when the network drops instead of waiting out the OS TCP
+# timeouts: give up on a connect after a few seconds, and have the kernel
+# probe idle sockets so a dead peer is noticed within about half a minute.
+CONNECT_OPTIONS = {
+    'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+    'keepalives': 1,
+    'keepalives_idle': 10,
+    'keepalives_interval': 5,
+    'keepalives_count': 3,
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(POOL_MAX_CONN)
+_last_used = {}
+# Tracked here rather than read off the pool's private attributes: ids of
+# connections currently checked out, and of every open connection seen
+_in_use = set()
+_open = set()
+_track_lock = threading.Lock()
+_metrics = {
+    'checkouts': 0,
+    'checkins': 0,
+    'health_checks': 0,
+    'discarded': 0,
+    'timeouts': 0,
+    'peak_in_use': 0,
+}
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(
+                    POOL_MIN_CONN, POOL_MAX_CONN, os.environ['DATABASE_URL'], **CONNECT_OPTIONS
+                )
+    return _pool
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < HEALTH_CHECK_IDLE_SECONDS:
+        return True
+    _metrics['health_checks'] += 1
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _discard(p, conn):
+    _metrics['discarded'] += 1
+    _last_used.pop(id(conn), None)
+    with _track_lock:
+        _in_use.discard(id(conn))
+        _open.discard(id(conn))
+    p.putconn(conn, close=True)
+
+
+def _checkout():
+    if not _slots.acquire(timeout=POOL_CHECKOUT_TIMEOUT):
+        _metrics['timeouts'] += 1
+        raise pool.PoolError("Timed out waiting for a database connection")
+    p = get_pool()
+    try:
+        # A pool of POOL_MAX_CONN can only ever hand us that many dead
+        # connections before it has to open a fresh one.
+        for _ in range(POOL_MAX_CONN + 1):
+            conn = p.getconn()
+            if _is_healthy(conn):
+                break
+            _discard(p, conn)
+        else:
+            raise pool.PoolError("Could not obtain a healthy database connection")
+    except Exception:
+        _slots.release()
+        raise
+    with _track_lock:
+        _in_use.add(id(conn))
+        _open.add(id(conn))
+        _metrics['checkouts'] += 1
+        _metrics['peak_in_use'] = max(_metrics['peak_in_use'], len(_in_use))
+    return p, conn
+
+
+def _checkin(p, conn, broken=False):
+    try:
+        if broken or conn.closed:
+            _discard(p, conn)
+            return
+        try:
+            # Never hand the next caller a connection with an open transaction
+            conn.rollback()
+        except psycopg2.Error:
+            _discard(p, conn)
+            return
+        _last_used[id(conn)] = time.monotonic()
+        with _track_lock:
+            _in_use.discard(id(conn))
+            _metrics['checkins'] += 1
+        p.putconn(conn)
+        if conn.closed:
+            # The pool closes rather than keeps anything beyond minconn
+            with _track_lock:
+                _open.discard(id(conn))
+    finally:
+        _slots.release()
+
+
+@contextmanager
+def get_connection():
+    """Check a connection out of the shared pool for the duration of a block.
+
+    Callers commit their own writes; anything left uncommitted is rolled
+    back when the connection goes back to the pool. Connections that fail
+    with a connection-level error are closed instead of being reused.
+    """
+    p, conn = _checkout()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        _checkin(p, conn, broken)
+
+
+def pool_stats():
+    """Snapshot of pool size and usage counters for the admin views.
+
+    idle counts open connections this process has used at least once; ones
+    the pool opened up front and never handed out aren't included.
+    """
+    with _track_lock:
+        stats = dict(_metrics)
+        stats['in_use'] = len(_in_use)
+        stats['idle'] = len(_open) - len(_in_use)
+    stats['min_size'] = POOL_MIN_CONN
+    stats['max_size'] = POOL_MAX_CONN
+    return stats
@@ -1,63 +1,30 @@
 
 import os
 import psycopg2
+from psycopg2.extras import execute_values
 import pandas as pd
+from importer import ROSTER_CSV_COLUMNS, prepare_roster_csv
+from migrations import ensure_schema, migrate
 
 def create_attendees_table():
+    conn = cur = None
     try:
+        # The table itself is created and kept current by migrations.py
+        ensure_schema()
+
         # Connect to the PostgreSQL database
         conn = psycopg2.connect(os.environ['DATABASE_URL'])
         cur = conn.cursor()
         
-        # Create attendees table
-        cur.execute("""
-        DROP TABLE IF EXISTS attendees;
-        CREATE TABLE attendees (
-            prefix TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            suffix TEXT,
-            school_system TEXT,
-            grade_subject TEXT,
-            bringing_plus_one BOOLEAN,
-            email TEXT,
-            status TEXT,
-            school_cleaned TEXT,
-            qr_code TEXT,
-            attendance_response TEXT,
-            checked_in INTEGER DEFAULT 0,
-            year INTEGER DEFAULT 2026
-        );
-        """)
-        
-        # Read CSV and insert data
-        df = pd.read_csv('tad.csv')
-        
-        # Insert data into the database
-        for _, row in df.iterrows():
-            year_value = row.get('year', 2026)
-            cur.execute("""
-            INSERT INTO attendees (
-                prefix, first_name, last_name, suffix, 
-                school_system, grade_subject, bringing_plus_one,
-                email, status, school_cleaned, qr_code,
-                attendance_response, year
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                row['prefix'],
-                row['first_name'],
-                row['last_name'],
-                row['suffix'],
-                row['school_system'],
-                row['grade_subject'],
-                row['bringing_plus_one'] == 'Yes',
-                row['email'],
-                row['status'],
-                row['school_cleaned'],
-                row['qr_code'],
-                row['attendance_response'],
-                year_value
-            ))
+        # Read CSV and load it, refreshing any attendees already there
+        df = prepare_roster_csv(pd.read_csv('tad.csv'))
+        rows = df[ROSTER_CSV_COLUMNS + ['year']].astype(object).values.tolist()
+        updates = ', '.join(f"{col} = EXCLUDED.{col}" for col in ROSTER_CSV_COLUMNS if col != 'qr_code')
+        execute_values(cur, f"""
+            INSERT INTO attendees ({', '.join(ROSTER_CSV_COLUMNS)}, year)
+            VALUES %s
+            ON CONFLICT (year, qr_code) DO UPDATE SET {updates}
+        """, rows)
         
         conn.commit()
         print("Table created and data imported successfully!")
@@ -71,6 +38,7 @@ def create_attendees_table():
             conn.close()
 
 def get_table_info():
+    conn = cur = None
     try:
         conn = psycopg2.connect(os.environ['DATABASE_URL'])
         cur = conn.cursor()
@@ -97,6 +65,7 @@ def get_table_info():
 
 
 def reset_check_ins():
+    conn = cur = None
     try:
         conn = psycopg2.connect(os.environ['DATABASE_URL'])
         cur = conn.cursor()
@@ -107,6 +76,8 @@ def reset_check_ins():
         SET checked_in = 0, 
             status = 'Not Checked In'
         """)
+        # Sponsor guests are checked in on their ticket (migration 9)
+        cur.execute("UPDATE sponsor_tickets SET checked_in = 0")
         
         conn.commit()
         print("Successfully reset all check-in statuses!")
@@ -122,10 +93,13 @@ def reset_check_ins():
 
 
 if __name__ == "__main__":
-    user_input = input("Enter 1 to get table info, 2 to create attendees table, 6 to reset check-ins: ")
+    user_input = input("Enter 1 to get table info, 2 to create attendees table, 3 to apply migrations, 6 to reset check-ins: ")
     if user_input == '1':
         get_table_info()
     elif user_input == '2':
         create_attendees_table()
+    elif user_input == '3':
+        applied = migrate()
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
     elif user_input == '6':
         reset_check_ins()
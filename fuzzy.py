@@ -0,0 +1,152 @@
+import heapq
+import re
+import threading
+from collections import defaultdict
+
+from attendees import CURRENT_YEAR
+from roster import get_roster
+from search import SEARCH_COLUMNS
+
+FUZZY_LIMIT = 5
+# Tokens sharing fewer trigrams than this are not worth an edit-distance check
+MIN_TRIGRAM_SIMILARITY = 0.2
+# Token pairs less similar than this are ignored entirely
+MIN_TOKEN_SIMILARITY = 0.5
+# Candidates scoring below this aren't worth showing to door staff
+MIN_SCORE = 0.45
+# A school match helps, but never as much as a name match
+FIELD_WEIGHTS = {
+    'first_name': 1.0,
+    'last_name': 1.0,
+    'school_cleaned': 0.6,
+    'school_system': 0.4,
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def _trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_similarity(a, b):
+    """1 minus the Levenshtein distance, scaled by the longer token."""
+    if a == b:
+        return 1.0
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return 1 - previous[-1] / max(len(a), len(b))
+
+
+class FuzzyIndex:
+    """Trigram index over attendee names and schools.
+
+    Every distinct token is stored once with its trigrams, and each trigram
+    points at the tokens containing it. A query token is only compared with
+    tokens sharing enough trigrams (Dice coefficient), and those few are
+    rescored by edit distance, which copes better with short names. Lookups
+    stay in the low milliseconds for thousands of attendees.
+    """
+
+    def __init__(self, entries):
+        token_ids = {}
+        self._token_text = []
+        self._token_grams = []
+        self._token_entries = []
+        self._postings = defaultdict(list)
+        self._codes = []
+        for entry in entries:
+            entry_idx = len(self._codes)
+            self._codes.append(str(entry['qr_code']))
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in _tokens(entry.get(field)):
+                    token_id = token_ids.get(token)
+                    if token_id is None:
+                        token_id = token_ids[token] = len(self._token_grams)
+                        grams = _trigrams(token)
+                        self._token_text.append(token)
+                        self._token_grams.append(len(grams))
+                        self._token_entries.append({})
+                        for gram in grams:
+                            self._postings[gram].append(token_id)
+                    owners = self._token_entries[token_id]
+                    owners[entry_idx] = max(owners.get(entry_idx, 0), weight)
+
+    def _similar_tokens(self, token):
+        grams = _trigrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for token_id in self._postings.get(gram, ()):
+                shared[token_id] += 1
+        for token_id, common in shared.items():
+            similarity = 2 * common / (len(grams) + self._token_grams[token_id])
+            if similarity < MIN_TRIGRAM_SIMILARITY:
+                continue
+            similarity = max(similarity, _edit_similarity(token, self._token_text[token_id]))
+            if similarity >= MIN_TOKEN_SIMILARITY:
+                yield token_id, similarity
+
+    def search(self, query, limit=FUZZY_LIMIT):
+        """Return (score, qr_code) pairs for the best matches, best first."""
+        query_tokens = _tokens(query)
+        if not query_tokens:
+            return []
+        totals = defaultdict(float)
+        for token in query_tokens:
+            best = {}
+            for token_id, similarity in self._similar_tokens(token):
+                for entry_idx, weight in self._token_entries[token_id].items():
+                    score = similarity * weight
+                    if score > best.get(entry_idx, 0):
+                        best[entry_idx] = score
+            for entry_idx, score in best.items():
+                totals[entry_idx] += score
+        top = heapq.nlargest(limit, totals.items(), key=lambda item: item[1])
+        return [
+            (total / len(query_tokens), self._codes[entry_idx])
+            for entry_idx, total in top
+            if total / len(query_tokens) >= MIN_SCORE
+        ]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_fuzzy_index(year=CURRENT_YEAR):
+    """Index for a year's roster, rebuilt only when names or schools change.
+
+    Never queries the database itself; the roster is kept fresh by scans
+    and by the offline station's sync thread.
+    """
+    roster = get_roster(year)
+    cached = _indexes.get(year)
+    if cached is None or cached[0] != roster.names_version:
+        with _indexes_lock:
+            cached = _indexes.get(year)
+            if cached is None or cached[0] != roster.names_version:
+                cached = (roster.names_version, FuzzyIndex(roster.entries(refresh=False)))
+                _indexes[year] = cached
+    return cached[1]
+
+
+def fuzzy_search(query, year=CURRENT_YEAR, limit=FUZZY_LIMIT):
+    """Closest attendees to a possibly misspelled name, with a 'score' key."""
+    roster = get_roster(year)
+    results = []
+    for score, code in get_fuzzy_index(year).search(query, limit):
+        entry = roster.get(code, refresh=False)
+        if entry:
+            result = {c: entry[c] for c in SEARCH_COLUMNS}
+            result['score'] = score
+            results.append(result)
+    return results
@@ -0,0 +1,162 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from attendees import CURRENT_YEAR
+from db import get_connection
+
+REQUIRED_COLUMNS = ['Name', 'Email', 'Type', 'School System', 'ticket_id']
+
+# Column order of the staging table and of the CSV streamed into it
+STAGING_COLUMNS = [
+    'first_name', 'last_name', 'email', 'status', 'school_system',
+    'qr_code', 'toty', 'table_number',
+]
+_TEXT_COLUMNS = ['first_name', 'last_name', 'email', 'status', 'school_system', 'qr_code']
+
+# Columns of tad.csv, the invitation roster loaded by db_info and sync_qr_codes
+ROSTER_CSV_COLUMNS = [
+    'prefix', 'first_name', 'last_name', 'suffix', 'school_system',
+    'grade_subject', 'bringing_plus_one', 'email', 'status',
+    'school_cleaned', 'qr_code', 'attendance_response',
+]
+
+
+def normalize_text(series, default=''):
+    """Stripped strings with missing values replaced by default.
+
+    Whole-number floats (what pandas makes of an integer column with a blank
+    in it) are written without a trailing '.0', so ticket ids survive.
+    """
+    if pd.api.types.is_float_dtype(series):
+        whole = series.dropna()
+        if (whole == whole.round()).all():
+            series = series.astype('Int64')
+    text = series.astype('string').str.strip()
+    return text.fillna(default)
+
+
+def yes_to_bool(series):
+    """Map 'Yes' (any case, any surrounding space) to True and anything else to False."""
+    return series.astype('string').str.strip().str.lower().eq('yes').fillna(False).astype(bool)
+
+
+def prepare_roster_csv(df):
+    """Normalize a tad.csv frame for loading into attendees.
+
+    Text columns become stripped strings or None, qr_code becomes a string
+    and bringing_plus_one a real boolean.
+    """
+    prepared = df.reindex(columns=ROSTER_CSV_COLUMNS)
+    for col in ROSTER_CSV_COLUMNS:
+        if col != 'bringing_plus_one':
+            text = normalize_text(prepared[col], default=pd.NA)
+            prepared[col] = text.astype(object).where(text.notna() & text.ne(''), None)
+    prepared['bringing_plus_one'] = yes_to_bool(prepared['bringing_plus_one'])
+    if 'year' in df.columns:
+        prepared['year'] = pd.to_numeric(df['year'], errors='coerce').fillna(CURRENT_YEAR).astype(int)
+    else:
+        prepared['year'] = CURRENT_YEAR
+    return prepared
+
+
+def prepare_import_frame(df):
+    """Validate and normalize an uploaded attendee CSV.
+
+    All parsing is done column-at-a-time. Returns a frame with
+    STAGING_COLUMNS holding only the rows that can be imported, and a list
+    of (csv_line, name, message) for the rest.
+    """
+    full_name = normalize_text(df['Name'])
+    ticket_id = normalize_text(df['ticket_id'])
+    status = normalize_text(df['Type'])
+    # Back to strings: an empty or single-word column splits into fewer
+    # (float) columns, which reindex then pads with NaN
+    name_parts = full_name.str.split(' ', n=1, expand=True).reindex(columns=[0, 1]).astype('string')
+
+    if 'Table' in df.columns:
+        table = pd.to_numeric(df['Table'], errors='coerce')
+        table_number = np.trunc(table).astype('Int64')
+    else:
+        table_number = pd.Series(pd.NA, index=df.index, dtype='Int64')
+
+    prepared = pd.DataFrame({
+        'first_name': name_parts[0].fillna(''),
+        'last_name': name_parts[1].fillna('').str.strip(),
+        'email': normalize_text(df['Email']),
+        'status': status,
+        'school_system': normalize_text(df['School System'], 'N/A'),
+        'qr_code': ticket_id,
+        'toty': status.eq('TOTY').astype(int),
+        'table_number': table_number,
+    }, index=df.index)
+
+    problems = [
+        (full_name.eq(''), lambda ticket: "Name is empty"),
+        (ticket_id.eq(''), lambda ticket: "ticket_id is empty"),
+        (ticket_id.ne('') & ticket_id.duplicated(keep='first'),
+         lambda ticket: f"ticket_id {ticket} appears more than once"),
+    ]
+    rejected = pd.Series(False, index=df.index)
+    errors = []
+    for mask, message in problems:
+        # Report each bad row once, for the first problem found
+        mask = mask & ~rejected
+        rejected |= mask
+        for idx in df.index[mask]:
+            errors.append((idx + 2, full_name[idx], message(ticket_id[idx])))  # header is line 1
+    errors.sort()
+
+    return prepared.loc[~rejected, STAGING_COLUMNS].reset_index(drop=True), errors
+
+
+def bulk_import(prepared, year=CURRENT_YEAR):
+    """Load a prepared frame with one COPY and merge it into attendees.
+
+    Everything happens in one transaction, so either every valid row lands
+    or none do. Returns (inserted, updated).
+    """
+    buffer = io.StringIO()
+    prepared[STAGING_COLUMNS].to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE attendee_import (
+                first_name TEXT,
+                last_name TEXT,
+                email TEXT,
+                status TEXT,
+                school_system TEXT,
+                qr_code TEXT,
+                toty INTEGER,
+                table_number INTEGER
+            ) ON COMMIT DROP
+        """)
+        cur.copy_expert(
+            f"COPY attendee_import ({', '.join(STAGING_COLUMNS)}) FROM STDIN "
+            f"WITH (FORMAT csv, FORCE_NOT_NULL ({', '.join(_TEXT_COLUMNS)}))",
+            buffer,
+        )
+        # xmax is only set on rows that already existed, which tells
+        # inserts and updates apart without a second query
+        cur.execute("""
+            INSERT INTO attendees (first_name, last_name, email, status, school_system, qr_code, checked_in, toty, year, table_number)
+            SELECT first_name, last_name, email, status, school_system, qr_code, 0, toty, %s, table_number
+            FROM attendee_import
+            ON CONFLICT (year, qr_code) DO UPDATE SET
+                first_name = EXCLUDED.first_name,
+                last_name = EXCLUDED.last_name,
+                email = EXCLUDED.email,
+                status = EXCLUDED.status,
+                school_system = EXCLUDED.school_system,
+                toty = EXCLUDED.toty,
+                table_number = EXCLUDED.table_number
+            RETURNING xmax = 0
+        """, (year,))
+        results = [row[0] for row in cur.fetchall()]
+        inserted = sum(results)
+        updated = len(results) - inserted
+        conn.commit()
+    return inserted, updated
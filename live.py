@@ -0,0 +1,115 @@
+import json
+import os
+import select
+import threading
+import time
+from collections import deque
+
+import psycopg2
+
+from db import CONNECT_OPTIONS
+
+CHECKIN_CHANNEL = 'attendee_checkins'
+# Enough history for a dashboard that missed a few refreshes to catch up
+FEED_HISTORY = 1000
+RECONNECT_SECONDS = 5
+# A quiet LISTEN connection is pinged this often so a dropped one is noticed
+LISTEN_PING_SECONDS = 30
+
+
+class CheckinFeed:
+    """Process-wide stream of check-in changes pushed by PostgreSQL.
+
+    A single background thread LISTENs on its own connection (migration 5
+    NOTIFYs on every checked_in change) and appends each change with an
+    increasing sequence number. Dashboards poll events_since() from memory,
+    so any number of open dashboards cost one database connection in total.
+    """
+
+    def __init__(self, history=FEED_HISTORY):
+        self._events = deque(maxlen=history)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.connected = False
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name='checkin-feed', daemon=True)
+                self._thread.start()
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(os.environ['DATABASE_URL'], **CONNECT_OPTIONS)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHECKIN_CHANNEL}")
+                self.connected = True
+                while True:
+                    if select.select([conn], [], [], LISTEN_PING_SECONDS) == ([], [], []):
+                        # Nothing for a while; make sure the connection is
+                        # still there (raises, and so reconnects, if not)
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT 1")
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._publish(json.loads(conn.notifies.pop(0).payload))
+            except Exception:
+                self.connected = False
+                time.sleep(RECONNECT_SECONDS)
+            finally:
+                if conn:
+                    conn.close()
+
+    def _publish(self, event):
+        with self._lock:
+            self._seq += 1
+            event['seq'] = self._seq
+            self._events.append(event)
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def events_since(self, seq):
+        """Events after seq, or None if some have already been dropped."""
+        with self._lock:
+            if self._events and self._events[0]['seq'] > seq + 1:
+                return None
+            return [e for e in self._events if e['seq'] > seq]
+
+
+def apply_checkin_events(stats, events, year):
+    """Fold check-in events into a get_attendance_stats() result in place.
+
+    checked_in is also the headcount (0, 1, or 2 with a plus one), so each
+    event changes the totals by the difference between its two values.
+    """
+    for event in events:
+        if event['year'] != year:
+            continue
+        delta = event['checked_in'] - event['previous']
+        stats['total_checked_in'] += delta
+        school = event['school_system']
+        if school in stats['by_school_system']:
+            stats['by_school_system'][school] += delta
+    return stats
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def get_checkin_feed():
+    """Return the process-wide feed, starting its listener on first use."""
+    global _feed
+    if _feed is None:
+        with _feed_lock:
+            if _feed is None:
+                _feed = CheckinFeed()
+                _feed.start()
+    return _feed
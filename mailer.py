@@ -0,0 +1,630 @@
+import base64
+import html
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import requests
+
+from psycopg2.extras import execute_values
+
+from db import get_connection
+from tickets import EVENT_DETAILS, generate_qr_code_base64
+
+GMAIL_SEND_URL = 'https://gmail.googleapis.com/gmail/v1/users/me/messages/send'
+# Never let a slow Google endpoint hold a sender thread indefinitely
+REQUEST_TIMEOUT = 20
+MAX_CONCURRENT_SENDS = 4
+MAX_ATTEMPTS = 5
+# Retry delays double from the base up to the cap
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+# Refresh access tokens this long before Google says they expire
+TOKEN_REFRESH_MARGIN = 300
+# Assumed lifetime when the token endpoint doesn't say (Google's is an hour)
+DEFAULT_TOKEN_LIFETIME = 3000
+# Taken off an absolute expiry, in case our clock and the issuer's disagree
+EXPIRY_CLOCK_SKEW = 60
+# How often the worker looks for due messages when nothing wakes it up
+POLL_SECONDS = 15
+# Messages stuck in 'sending' this long belong to a worker that died
+STALE_SENDING_MINUTES = 15
+
+EMAIL_RE = re.compile(r"^[^@\s,;<>]+@[^@\s,;<>]+\.[^@\s,;<>]+$")
+_ANGLE_RE = re.compile(r"^(.*?)\s*<([^>]+)>\s*$")
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryError(Exception):
+    """An email that could not be sent, and whether trying again may help."""
+
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def _seconds_until(expires_at):
+    """Lifetime left before an absolute expiry, less EXPIRY_CLOCK_SKEW, or None.
+
+    Accepts an ISO 8601 timestamp or epoch seconds or milliseconds.
+    """
+    if expires_at is None or expires_at == '':
+        return None
+    try:
+        epoch = float(expires_at)
+    except (TypeError, ValueError):
+        try:
+            expiry = datetime.fromisoformat(str(expires_at).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if expiry.tzinfo is None:
+            expiry = expiry.replace(tzinfo=timezone.utc)
+        epoch = expiry.timestamp()
+    else:
+        if epoch > 1e12:
+            epoch /= 1000
+    return epoch - time.time() - EXPIRY_CLOCK_SKEW
+
+
+def _fetch_gmail_access_token():
+    """A fresh access token and its lifetime in seconds, or (None, None)."""
+    client_id = os.environ.get('GOOGLE_CLIENT_ID')
+    client_secret = os.environ.get('GOOGLE_CLIENT_SECRET')
+    refresh_token = os.environ.get('GOOGLE_REFRESH_TOKEN')
+
+    if client_id and client_secret and refresh_token:
+        try:
+            response = requests.post(
+                'https://oauth2.googleapis.com/token',
+                data={
+                    'client_id': client_id,
+                    'client_secret': client_secret,
+                    'refresh_token': refresh_token,
+                    'grant_type': 'refresh_token'
+                },
+                timeout=REQUEST_TIMEOUT,
+            )
+            if response.status_code == 200:
+                data = response.json()
+                return data.get('access_token'), data.get('expires_in')
+        except requests.RequestException:
+            return None, None
+
+    hostname = os.environ.get('REPLIT_CONNECTORS_HOSTNAME')
+    repl_identity = os.environ.get('REPL_IDENTITY')
+    web_repl_renewal = os.environ.get('WEB_REPL_RENEWAL')
+
+    if repl_identity:
+        x_replit_token = 'repl ' + repl_identity
+    elif web_repl_renewal:
+        x_replit_token = 'depl ' + web_repl_renewal
+    else:
+        return None, None
+
+    try:
+        response = requests.get(
+            f'https://{hostname}/api/v2/connection?include_secrets=true&connector_names=google-mail',
+            headers={
+                'Accept': 'application/json',
+                'X_REPLIT_TOKEN': x_replit_token
+            },
+            timeout=REQUEST_TIMEOUT,
+        )
+        data = response.json()
+        connection = data.get('items', [{}])[0]
+        settings = connection.get('settings', {})
+        credentials = settings.get('oauth', {}).get('credentials', {})
+        access_token = settings.get('access_token') or credentials.get('access_token')
+        # The connector reports when the token expires, not how long it lasts
+        lifetime = _seconds_until(settings.get('expires_at') or credentials.get('expires_at'))
+        if lifetime is None:
+            lifetime = settings.get('expires_in') or credentials.get('expires_in')
+        return access_token, lifetime
+    except (requests.RequestException, ValueError, IndexError):
+        return None, None
+
+
+class TokenCache:
+    """Process-wide Gmail access token, reused until shortly before it expires.
+
+    A token is refreshed once it is within TOKEN_REFRESH_MARGIN of expiring.
+    Only one thread refreshes at a time: while the old token is still valid
+    the others keep using it, and once it has expired they wait for the one
+    refresh instead of each starting their own.
+    """
+
+    def __init__(self):
+        self._token = None
+        self._expires_at = 0
+        self._refresh_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def _fresh(self, now):
+        return self._token is not None and now < self._expires_at - TOKEN_REFRESH_MARGIN
+
+    def _refresh(self):
+        self.misses += 1
+        token, expires_in = _fetch_gmail_access_token()
+        if not token:
+            self.failures += 1
+            return
+        try:
+            lifetime = float(expires_in)
+        except (TypeError, ValueError):
+            lifetime = DEFAULT_TOKEN_LIFETIME
+        self._token = token
+        self._expires_at = time.monotonic() + lifetime
+
+    def get(self):
+        now = time.monotonic()
+        if self._fresh(now):
+            self.hits += 1
+            return self._token
+        if self._token is not None and now < self._expires_at:
+            # Expiring soon but still usable: refresh only if nobody else is
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    self._refresh()
+                finally:
+                    self._refresh_lock.release()
+            else:
+                self.hits += 1
+            return self._token
+        with self._refresh_lock:
+            if self._fresh(time.monotonic()):
+                self.hits += 1
+            else:
+                self._refresh()
+        return self._token if time.monotonic() < self._expires_at else None
+
+    def invalidate(self):
+        """Forget the current token, e.g. after Gmail rejected it."""
+        self._expires_at = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'failures': self.failures,
+            'expires_in': max(0, round(self._expires_at - time.monotonic())) if self._token else 0,
+        }
+
+
+_tokens = TokenCache()
+
+
+def get_gmail_access_token():
+    return _tokens.get()
+
+
+def token_cache_stats():
+    """Hit, miss and failure counts of the access token cache, for the admin view."""
+    return _tokens.stats()
+
+
+def build_ticket_message(recipient_email, recipient_name, ticket_number, company_name):
+    """The ticket email as a base64url-encoded MIME message for the Gmail API."""
+    qr_base64 = generate_qr_code_base64(ticket_number)
+
+    html_content = f"""
+    <html>
+    <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+        <div style="background-color: #2c5282; color: white; padding: 20px; text-align: center;">
+            <h1>Teacher Appreciation Dinner</h1>
+            <p>Your Ticket</p>
+        </div>
+        <div style="padding: 20px; border: 1px solid #ddd;">
+            <p>Dear {html.escape(recipient_name)},</p>
+            <p>You have been invited to attend the <strong>Teacher Appreciation Dinner</strong> as a guest of <strong>{html.escape(company_name or '')}</strong>.</p>
+
+            <div style="background-color: #f7fafc; border: 2px solid #2c5282; padding: 20px; margin: 20px 0; text-align: center;">
+                <img src="data:image/png;base64,{qr_base64}" alt="QR Code" style="width: 150px; height: 150px;">
+                <h2 style="color: #2c5282; margin: 10px 0; font-size: 32px; letter-spacing: 5px;">{ticket_number}</h2>
+                <p style="color: #666; font-size: 12px;">Scan QR code or provide this number at check-in</p>
+            </div>
+
+            <h3>Event Details:</h3>
+            <ul>
+                <li><strong>Date:</strong> {EVENT_DETAILS['date']}</li>
+                <li><strong>Venue:</strong> {EVENT_DETAILS['venue']}</li>
+                <li><strong>Address:</strong> {EVENT_DETAILS['address']}</li>
+                <li><strong>Doors Open:</strong> {EVENT_DETAILS['doors_open']}</li>
+                <li><strong>Dinner Served:</strong> {EVENT_DETAILS['dinner_served']}</li>
+                <li><strong>Keynote Speaker:</strong> {EVENT_DETAILS['keynote_speaker']}</li>
+            </ul>
+
+            <p>Please present this email or your ticket number at check-in.</p>
+            <p>We look forward to seeing you!</p>
+        </div>
+        <div style="background-color: #edf2f7; padding: 10px; text-align: center; font-size: 12px;">
+            <p>Valdosta-North Rotary Teacher Appreciation Dinner</p>
+        </div>
+    </body>
+    </html>
+    """
+
+    sender_email = os.environ.get('GMAIL_SENDER_EMAIL', 'noreply@example.com')
+    sender_name = os.environ.get('GMAIL_SENDER_NAME', 'Valdosta-North Rotary')
+
+    message = MIMEMultipart('alternative')
+    message['From'] = f"{sender_name} <{sender_email}>"
+    message['To'] = recipient_email
+    message['Subject'] = f"Your Ticket to the Teacher Appreciation Dinner - {EVENT_DETAILS['date']}"
+
+    text_part = MIMEText(f"You are invited to the Teacher Appreciation Dinner. Ticket #{ticket_number}. Date: {EVENT_DETAILS['date']}. Venue: {EVENT_DETAILS['venue']}, {EVENT_DETAILS['address']}", 'plain')
+    html_part = MIMEText(html_content, 'html')
+
+    message.attach(text_part)
+    message.attach(html_part)
+
+    return base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def send_ticket_email(recipient_email, recipient_name, ticket_number, company_name):
+    """Send one ticket email now. Raises DeliveryError on failure."""
+    access_token = get_gmail_access_token()
+    if not access_token:
+        raise DeliveryError("Gmail not connected")
+
+    raw_message = build_ticket_message(recipient_email, recipient_name, ticket_number, company_name)
+    try:
+        response = requests.post(
+            GMAIL_SEND_URL,
+            headers={
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            },
+            json={'raw': raw_message},
+            timeout=REQUEST_TIMEOUT,
+        )
+    except requests.RequestException as e:
+        raise DeliveryError(str(e))
+
+    if response.status_code == 200:
+        return
+    if response.status_code == 401:
+        _tokens.invalidate()
+    # Rate limits, expired tokens and server errors are worth another try;
+    # anything else (a malformed address, say) will fail the same way again
+    retryable = response.status_code in (401, 403, 429) or response.status_code >= 500
+    raise DeliveryError(f"Failed to send: {response.text}", retryable, _retry_after(response))
+
+
+def queue_ticket_email(ticket_id, recipient_email, recipient_name, ticket_number, company_name):
+    """Assign a ticket and queue its email, in one transaction.
+
+    A ticket is assigned if it is still free (not emailed or printed), or
+    if its last email failed for good - that is how a mistyped address is
+    corrected. The failed email is marked 'replaced' so a retry can't send
+    it after all. Returns False, queueing nothing, if the ticket is taken,
+    so this can't race a bulk send or a retry for the same ticket. The
+    ticket's sent_at is only filled in once the email has actually gone.
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        # Lock first so the checks below see any assignment or retry that won the race
+        cur.execute("SELECT recipient_email, printed_at FROM sponsor_tickets WHERE id = %s FOR UPDATE",
+                    (ticket_id,))
+        ticket = cur.fetchone()
+        if ticket is None or ticket[1] is not None:
+            return False
+        if ticket[0] is not None:
+            cur.execute("SELECT status FROM email_outbox WHERE ticket_id = %s ORDER BY id DESC LIMIT 1",
+                        (ticket_id,))
+            latest = cur.fetchone()
+            if latest is None or latest[0] != 'failed':
+                return False
+            cur.execute("UPDATE email_outbox SET status = 'replaced' WHERE ticket_id = %s AND status = 'failed'",
+                        (ticket_id,))
+        cur.execute("""
+            UPDATE sponsor_tickets
+            SET recipient_email = %s, recipient_name = %s, sent_at = NULL
+            WHERE id = %s
+        """, (recipient_email, recipient_name, ticket_id))
+        cur.execute("""
+            INSERT INTO email_outbox (ticket_id, recipient_email, recipient_name, ticket_number, company_name)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (ticket_id, recipient_email, recipient_name, ticket_number, company_name))
+        conn.commit()
+    get_outbox_worker().wake()
+    return True
+
+
+def parse_recipients(text, seen=None):
+    """(name, email) pairs from pasted or uploaded text, one per line.
+
+    Accepts 'Name, email', tab-separated columns pasted from a spreadsheet
+    and 'Name <email>'. A header on the first non-empty line is skipped.
+    Pass the same seen set when parsing several sources to reject emails
+    repeated across them. Returns (recipients, errors) with errors as
+    (line_number, line, message).
+    """
+    recipients = []
+    errors = []
+    if seen is None:
+        seen = set()
+    first = True
+    for line_number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        is_first, first = first, False
+        angle = _ANGLE_RE.match(line)
+        if angle:
+            name, email = angle.groups()
+        elif '\t' in line:
+            name, _, email = line.partition('\t')
+        else:
+            name, separator, email = line.rpartition(',')
+            if not separator:
+                # A lone value: an address without a name, or a name without an address
+                name, email = ('', line) if EMAIL_RE.match(line) else (line, '')
+        name = name.strip().strip('"').strip()
+        email = email.strip().strip('"').strip()
+        if is_first and email.lower() in ('email', 'e-mail', 'email address'):
+            continue
+        if not name:
+            errors.append((line_number, line, "Name is missing"))
+        elif not email:
+            errors.append((line_number, line, "Email is missing or invalid"))
+        elif not EMAIL_RE.match(email):
+            errors.append((line_number, line, "Not a valid email address"))
+        elif email.lower() in seen:
+            errors.append((line_number, line, "Email listed more than once"))
+        else:
+            seen.add(email.lower())
+            recipients.append((name, email))
+    return recipients, errors
+
+
+def queue_bulk_ticket_emails(sponsor_id, company_name, recipients, year):
+    """Assign recipients to a sponsor's free tickets and queue their emails.
+
+    Free tickets are locked, assigned and queued in one transaction, in
+    ticket order. Returns (queued, unassigned): queued as (outbox_id, name,
+    email, ticket_number), unassigned as the (name, email) pairs left over
+    when the sponsor ran out of tickets.
+    """
+    if not recipients:
+        return [], []
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, ticket_number FROM sponsor_tickets
+            WHERE sponsor_id = %s AND year = %s
+              AND recipient_email IS NULL AND printed_at IS NULL
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (sponsor_id, year, len(recipients)))
+        free = cur.fetchall()
+        assignments = [
+            (ticket_id, ticket_number, name, email)
+            for (ticket_id, ticket_number), (name, email) in zip(free, recipients)
+        ]
+        if assignments:
+            execute_values(cur, """
+                UPDATE sponsor_tickets t
+                SET recipient_name = v.name, recipient_email = v.email, sent_at = NULL
+                FROM (VALUES %s) AS v (id, name, email)
+                WHERE t.id = v.id
+            """, [(ticket_id, name, email) for ticket_id, _, name, email in assignments])
+            queued = execute_values(cur, """
+                INSERT INTO email_outbox (ticket_id, recipient_email, recipient_name, ticket_number, company_name)
+                VALUES %s
+                RETURNING id, recipient_name, recipient_email, ticket_number
+            """, [(ticket_id, email, name, ticket_number, company_name)
+                  for ticket_id, ticket_number, name, email in assignments], fetch=True)
+        else:
+            queued = []
+        conn.commit()
+    get_outbox_worker().wake()
+    return queued, recipients[len(assignments):]
+
+
+def get_outbox_status(outbox_ids):
+    """{outbox_id: (status, last_error)} for the given outbox rows."""
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, status, last_error FROM email_outbox WHERE id = ANY(%s)
+        """, (list(outbox_ids),))
+        return {outbox_id: (status, error) for outbox_id, status, error in cur.fetchall()}
+
+
+def retry_ticket_email(ticket_id):
+    """Put a ticket's failed email back in the queue."""
+    with get_connection() as conn, conn.cursor() as cur:
+        # Same lock as queue_ticket_email, so a retry and a new recipient can't both go out
+        cur.execute("SELECT id FROM sponsor_tickets WHERE id = %s FOR UPDATE", (ticket_id,))
+        cur.execute("""
+            UPDATE email_outbox
+            SET status = 'pending', attempts = 0, next_attempt_at = now(), last_error = NULL
+            WHERE ticket_id = %s AND status = 'failed'
+        """, (ticket_id,))
+        conn.commit()
+    get_outbox_worker().wake()
+
+
+def get_delivery_status(sponsor_id):
+    """Latest outbox status per ticket of a sponsor: {ticket_id: (status, last_error)}."""
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT ON (o.ticket_id) o.ticket_id, o.status, o.last_error
+            FROM email_outbox o
+            JOIN sponsor_tickets t ON t.id = o.ticket_id
+            WHERE t.sponsor_id = %s
+            ORDER BY o.ticket_id, o.id DESC
+        """, (sponsor_id,))
+        return {ticket_id: (status, error) for ticket_id, status, error in cur.fetchall()}
+
+
+class OutboxWorker:
+    """Background sender for the email_outbox table.
+
+    One thread claims due messages (FOR UPDATE SKIP LOCKED, so several app
+    processes can share the table) and sends up to MAX_CONCURRENT_SENDS at a
+    time. Failures are retried with exponential backoff, honoring Gmail's
+    Retry-After; a rate limit pauses the whole worker rather than just the
+    one message. On success the outbox row and the ticket both get sent_at.
+
+    Database errors while recording an outcome never escape a send. A sent
+    message that couldn't be recorded is remembered and recorded on the
+    next poll, before stale claims are released, so it isn't sent twice.
+    """
+
+    def __init__(self, concurrency=MAX_CONCURRENT_SENDS):
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='email-send')
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._paused_until = 0
+        # outbox_id -> ticket_id for messages Gmail accepted but not yet marked sent
+        self._unrecorded = {}
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._record_unrecorded()
+            self._release_stale()
+            try:
+                delay = self._paused_until - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                batch = self._claim(self.concurrency)
+                if batch:
+                    for _ in self._executor.map(self._send, batch):
+                        pass
+                    continue
+            except Exception:
+                # Database unavailable; try again on the next poll
+                logger.exception("Email outbox poll failed")
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+
+    def _release_stale(self):
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE email_outbox SET status = 'pending'
+                    WHERE status = 'sending' AND claimed_at < now() - %s * interval '1 minute'
+                """, (STALE_SENDING_MINUTES,))
+                conn.commit()
+        except Exception:
+            logger.exception("Could not release stale email outbox claims")
+
+    def _claim(self, limit):
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                UPDATE email_outbox
+                SET status = 'sending', attempts = attempts + 1, claimed_at = now()
+                WHERE id IN (
+                    SELECT id FROM email_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= now()
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, ticket_id, recipient_email, recipient_name, ticket_number, company_name, attempts
+            """, (limit,))
+            batch = cur.fetchall()
+            conn.commit()
+        return batch
+
+    def _send(self, message):
+        outbox_id, ticket_id, email, name, ticket_number, company_name, attempts = message
+        try:
+            send_ticket_email(email, name, ticket_number, company_name)
+        except DeliveryError as e:
+            self._record_failure(outbox_id, attempts, e)
+            return
+        except Exception as e:
+            self._record_failure(outbox_id, attempts, DeliveryError(str(e)))
+            return
+        self.sent += 1
+        with self._lock:
+            self._unrecorded[outbox_id] = ticket_id
+        self._record_unrecorded()
+
+    def _record_unrecorded(self):
+        with self._lock:
+            pending = dict(self._unrecorded)
+        if not pending:
+            return
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE email_outbox SET status = 'sent', sent_at = now(), last_error = NULL
+                    WHERE id = ANY(%s)
+                """, (list(pending),))
+                cur.execute("UPDATE sponsor_tickets SET sent_at = now() WHERE id = ANY(%s)",
+                            (list(pending.values()),))
+                conn.commit()
+        except Exception:
+            logger.exception("Could not record sent emails %s; will retry", sorted(pending))
+            return
+        with self._lock:
+            for outbox_id in pending:
+                self._unrecorded.pop(outbox_id, None)
+
+    def _record_failure(self, outbox_id, attempts, error):
+        if error.retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + error.retry_after)
+        if error.retryable and attempts < MAX_ATTEMPTS:
+            delay = error.retry_after or min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+            status = 'pending'
+        else:
+            delay = 0
+            status = 'failed'
+            self.failed += 1
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE email_outbox
+                    SET status = %s, last_error = %s, next_attempt_at = now() + %s * interval '1 second'
+                    WHERE id = %s
+                """, (status, str(error), delay, outbox_id))
+                conn.commit()
+        except Exception:
+            # The claim goes stale and the message is tried again
+            logger.exception("Could not record failure of email %s", outbox_id)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_outbox_worker():
+    """Return the process-wide outbox worker, starting it on first use."""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = OutboxWorker()
+                _worker.start()
+    return _worker
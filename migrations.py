@@ -0,0 +1,328 @@
+import threading
+
+from db import get_connection
+
+# Ordered list of (version, description, sql). Append only - never edit a
+# migration once it has shipped; add a new one instead. Every migration must
+# be safe to run against a database that predates this module, which is why
+# they use IF NOT EXISTS throughout.
+MIGRATIONS = [
+    (0, "Baseline attendees, sponsors and sponsor_tickets tables", """
+        CREATE TABLE IF NOT EXISTS attendees (
+            prefix TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            suffix TEXT,
+            school_system TEXT,
+            grade_subject TEXT,
+            bringing_plus_one BOOLEAN,
+            email TEXT,
+            status TEXT,
+            school_cleaned TEXT,
+            qr_code TEXT,
+            attendance_response TEXT,
+            checked_in INTEGER DEFAULT 0,
+            year INTEGER DEFAULT 2026
+        );
+        -- Columns that were added by hand over time (toty came from update_toty.py)
+        ALTER TABLE attendees ADD COLUMN IF NOT EXISTS toty INTEGER DEFAULT 0;
+        ALTER TABLE attendees ADD COLUMN IF NOT EXISTS table_number INTEGER;
+        ALTER TABLE attendees ADD COLUMN IF NOT EXISTS year INTEGER DEFAULT 2026;
+
+        CREATE TABLE IF NOT EXISTS sponsors (
+            id SERIAL PRIMARY KEY,
+            username TEXT NOT NULL,
+            password TEXT NOT NULL,
+            company_name TEXT,
+            sponsor_level TEXT,
+            total_seats INTEGER,
+            year INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS sponsor_tickets (
+            id SERIAL PRIMARY KEY,
+            sponsor_id INTEGER REFERENCES sponsors (id),
+            ticket_number TEXT,
+            recipient_email TEXT,
+            recipient_name TEXT,
+            sent_at TIMESTAMP,
+            printed_at TIMESTAMP,
+            year INTEGER
+        );
+    """),
+    (1, "Track attendee row changes with updated_at", """
+        ALTER TABLE attendees ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+        CREATE OR REPLACE FUNCTION attendees_touch_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := clock_timestamp();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS attendees_touch_updated_at ON attendees;
+        CREATE TRIGGER attendees_touch_updated_at
+            BEFORE INSERT OR UPDATE ON attendees
+            FOR EACH ROW EXECUTE FUNCTION attendees_touch_updated_at();
+
+        CREATE INDEX IF NOT EXISTS attendees_year_updated_at_idx ON attendees (year, updated_at);
+    """),
+    (2, "Index attendee names for search", """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+        -- Substring matches on first, last or full name
+        CREATE INDEX IF NOT EXISTS attendees_full_name_trgm_idx ON attendees
+            USING gin ((lower(coalesce(first_name, '') || ' ' || coalesce(last_name, ''))) gin_trgm_ops);
+
+        -- Prefix matches within a year
+        CREATE INDEX IF NOT EXISTS attendees_year_last_name_prefix_idx ON attendees
+            (year, lower(last_name) text_pattern_ops);
+        CREATE INDEX IF NOT EXISTS attendees_year_first_name_prefix_idx ON attendees
+            (year, lower(first_name) text_pattern_ops);
+    """),
+    (3, "Unique (year, qr_code) key and lookup indexes on attendees", """
+        DO $$
+        DECLARE
+            dupes TEXT;
+        BEGIN
+            SELECT string_agg(year || '/' || qr_code, ', ') INTO dupes
+            FROM (
+                SELECT year, qr_code FROM attendees
+                WHERE qr_code IS NOT NULL
+                GROUP BY year, qr_code
+                HAVING count(*) > 1
+            ) d;
+            IF dupes IS NOT NULL THEN
+                RAISE EXCEPTION 'Fix duplicate attendee codes (year/code) before migrating: %', dupes;
+            END IF;
+        END
+        $$;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS attendees_year_qr_code_key ON attendees (year, qr_code);
+        CREATE INDEX IF NOT EXISTS attendees_year_name_idx ON attendees (year, last_name, first_name);
+        CREATE INDEX IF NOT EXISTS attendees_year_checked_in_idx ON attendees (year, checked_in);
+    """),
+    (4, "tad_attendees table for the registration-form sync", """
+        CREATE TABLE IF NOT EXISTS tad_attendees (
+            prefix TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            suffix TEXT,
+            system TEXT,
+            grade TEXT,
+            plus_one BOOLEAN,
+            email TEXT,
+            status TEXT,
+            school TEXT,
+            id TEXT PRIMARY KEY
+        );
+    """),
+    (5, "Notify listeners when an attendee's check-in changes", """
+        CREATE OR REPLACE FUNCTION attendees_notify_checkin() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('attendee_checkins', json_build_object(
+                'year', NEW.year,
+                'qr_code', NEW.qr_code,
+                'first_name', NEW.first_name,
+                'last_name', NEW.last_name,
+                'school_system', NEW.school_system,
+                'previous', COALESCE(OLD.checked_in, 0),
+                'checked_in', COALESCE(NEW.checked_in, 0)
+            )::text);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS attendees_notify_checkin ON attendees;
+        CREATE TRIGGER attendees_notify_checkin
+            AFTER UPDATE OF checked_in ON attendees
+            FOR EACH ROW
+            WHEN (OLD.checked_in IS DISTINCT FROM NEW.checked_in)
+            EXECUTE FUNCTION attendees_notify_checkin();
+    """),
+    (6, "Keyset pagination index for the attendee list", """
+        -- Matches the ORDER BY in attendees.get_attendee_page and makes the
+        -- plain (year, last_name, first_name) index from migration 3 redundant
+        CREATE INDEX IF NOT EXISTS attendees_year_sort_key_idx ON attendees
+            (year, COALESCE(last_name, ''), COALESCE(first_name, ''), COALESCE(qr_code, ''));
+        DROP INDEX IF EXISTS attendees_year_name_idx;
+    """),
+    (7, "Outbox for sponsor ticket emails", """
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id SERIAL PRIMARY KEY,
+            ticket_id INTEGER REFERENCES sponsor_tickets (id) ON DELETE CASCADE,
+            recipient_email TEXT NOT NULL,
+            recipient_name TEXT,
+            ticket_number TEXT NOT NULL,
+            company_name TEXT,
+            -- pending -> sending -> sent, or failed once retries run out
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            claimed_at TIMESTAMPTZ,
+            last_error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            sent_at TIMESTAMPTZ
+        );
+        CREATE INDEX IF NOT EXISTS email_outbox_due_idx ON email_outbox (next_attempt_at)
+            WHERE status = 'pending';
+        CREATE INDEX IF NOT EXISTS email_outbox_ticket_idx ON email_outbox (ticket_id);
+    """),
+    (8, "Ticket number sequence and unique sponsor ticket numbers", """
+        -- One value per five-digit ticket number; see tickets.allocate_ticket_numbers
+        CREATE SEQUENCE IF NOT EXISTS ticket_number_seq MINVALUE 0 MAXVALUE 89999 CYCLE;
+
+        DO $$
+        DECLARE
+            dupes TEXT;
+        BEGIN
+            SELECT string_agg(year || '/' || ticket_number, ', ') INTO dupes
+            FROM (
+                SELECT year, ticket_number FROM sponsor_tickets
+                WHERE ticket_number IS NOT NULL
+                GROUP BY year, ticket_number
+                HAVING count(*) > 1
+            ) d;
+            IF dupes IS NOT NULL THEN
+                RAISE EXCEPTION 'Fix duplicate sponsor ticket numbers (year/number) before migrating: %', dupes;
+            END IF;
+        END
+        $$;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS sponsor_tickets_year_ticket_number_key
+            ON sponsor_tickets (year, ticket_number);
+    """),
+    (9, "Check in sponsor tickets directly through a ticket_holders view", """
+        ALTER TABLE sponsor_tickets ADD COLUMN IF NOT EXISTS checked_in INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE sponsor_tickets ADD COLUMN IF NOT EXISTS table_number INTEGER;
+        ALTER TABLE sponsor_tickets ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+        -- The function from migration 1 only touches NEW.updated_at
+        DROP TRIGGER IF EXISTS sponsor_tickets_touch_updated_at ON sponsor_tickets;
+        CREATE TRIGGER sponsor_tickets_touch_updated_at
+            BEFORE INSERT OR UPDATE ON sponsor_tickets
+            FOR EACH ROW EXECUTE FUNCTION attendees_touch_updated_at();
+        CREATE INDEX IF NOT EXISTS sponsor_tickets_year_updated_at_idx ON sponsor_tickets (year, updated_at);
+
+        -- Same payload as attendees_notify_checkin, so the live dashboard
+        -- counts sponsor guests too
+        CREATE OR REPLACE FUNCTION sponsor_tickets_notify_checkin() RETURNS trigger AS $$
+        DECLARE
+            company TEXT;
+        BEGIN
+            SELECT company_name INTO company FROM sponsors WHERE id = NEW.sponsor_id;
+            PERFORM pg_notify('attendee_checkins', json_build_object(
+                'year', NEW.year,
+                'qr_code', NEW.ticket_number,
+                'first_name', COALESCE(NULLIF(NEW.recipient_name, ''), company || ' Guest'),
+                'last_name', '',
+                'school_system', 'N/A',
+                'previous', COALESCE(OLD.checked_in, 0),
+                'checked_in', COALESCE(NEW.checked_in, 0)
+            )::text);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS sponsor_tickets_notify_checkin ON sponsor_tickets;
+        CREATE TRIGGER sponsor_tickets_notify_checkin
+            AFTER UPDATE OF checked_in ON sponsor_tickets
+            FOR EACH ROW
+            WHEN (OLD.checked_in IS DISTINCT FROM NEW.checked_in)
+            EXECUTE FUNCTION sponsor_tickets_notify_checkin();
+
+        -- Everyone who can be scanned in, keyed by (year, qr_code). A lookup
+        -- by key is one probe into each table's unique index. Sponsor
+        -- tickets already imported as attendees (the old CSV export) are
+        -- represented by their attendee row only.
+        CREATE OR REPLACE VIEW ticket_holders AS
+            SELECT 'attendee'::text AS source, year, qr_code, first_name, last_name,
+                   school_system, school_cleaned, bringing_plus_one, toty, status,
+                   table_number, checked_in, updated_at
+            FROM attendees
+            UNION ALL
+            SELECT 'sponsor'::text, t.year, t.ticket_number,
+                   COALESCE(NULLIF(t.recipient_name, ''), s.company_name || ' Guest'), '',
+                   'N/A', s.company_name, false, 0, 'Sponsor',
+                   t.table_number, t.checked_in, t.updated_at
+            FROM sponsor_tickets t
+            JOIN sponsors s ON s.id = t.sponsor_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM attendees a WHERE a.year = t.year AND a.qr_code = t.ticket_number
+            );
+    """),
+]
+
+LATEST_VERSIONS = {version for version, _, _ in MIGRATIONS}
+
+# Arbitrary key so concurrent app processes don't migrate at the same time
+MIGRATION_LOCK_ID = 7251926
+
+_migrated = False
+_migrate_lock = threading.Lock()
+
+
+def migrate():
+    """Apply any pending migrations, each in its own transaction."""
+    applied = []
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            conn.commit()
+            cur.execute("SELECT version FROM schema_version")
+            done = {row[0] for row in cur.fetchall()}
+            for version, description, sql in sorted(MIGRATIONS):
+                if version in done:
+                    continue
+                cur.execute(sql)
+                cur.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (version, description),
+                )
+                conn.commit()
+                applied.append(version)
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+    return applied
+
+
+def pending_versions():
+    """Versions not yet recorded in schema_version. One cheap read."""
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return sorted(LATEST_VERSIONS)
+        cur.execute("SELECT version FROM schema_version")
+        return sorted(LATEST_VERSIONS - {row[0] for row in cur.fetchall()})
+
+
+def ensure_schema():
+    """Make sure the schema is current, once per process.
+
+    The first call does a single read of schema_version and only takes the
+    migration lock if something is pending; later calls are free.
+    """
+    global _migrated
+    if _migrated:
+        return
+    with _migrate_lock:
+        if not _migrated:
+            if pending_versions():
+                migrate()
+            _migrated = True
+
+
+if __name__ == "__main__":
+    applied = migrate()
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        print("Schema is up to date")
@@ -0,0 +1,320 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as ScanTimeout
+from datetime import datetime, timezone
+
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import execute_values
+
+from attendees import CURRENT_YEAR, check_in_attendee
+from db import get_connection
+from roster import get_roster
+
+# Each scanner station keeps its own file next to the app
+OFFLINE_DB_PATH = os.environ.get('OFFLINE_DB_PATH', 'offline_checkins.sqlite3')
+# A scan that waits longer than this on the database is recorded locally instead
+ONLINE_SCAN_TIMEOUT = 1.5
+SYNC_INTERVAL_SECONDS = 5
+SYNC_BATCH_SIZE = 200
+
+SNAPSHOT_COLUMNS = [
+    'qr_code', 'first_name', 'last_name', 'school_system', 'school_cleaned',
+    'bringing_plus_one', 'toty', 'status', 'table_number', 'checked_in',
+]
+
+# Errors that mean the database can't be reached, as opposed to a bad query
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, pool.PoolError, ScanTimeout)
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS roster (
+        year INTEGER NOT NULL,
+        qr_code TEXT NOT NULL,
+        first_name TEXT,
+        last_name TEXT,
+        school_system TEXT,
+        school_cleaned TEXT,
+        bringing_plus_one INTEGER,
+        toty INTEGER,
+        status TEXT,
+        table_number INTEGER,
+        checked_in INTEGER,
+        PRIMARY KEY (year, qr_code)
+    );
+    -- Append-only: rows are marked synced, never updated otherwise or deleted
+    CREATE TABLE IF NOT EXISTS checkin_queue (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        year INTEGER NOT NULL,
+        qr_code TEXT NOT NULL,
+        checked_in INTEGER NOT NULL,
+        scanned_at TEXT NOT NULL,
+        synced_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS checkin_queue_pending_idx ON checkin_queue (id) WHERE synced_at IS NULL;
+"""
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _entry(row):
+    entry = dict(zip(SNAPSHOT_COLUMNS, row))
+    # SQLite has no boolean type
+    if entry['bringing_plus_one'] is not None:
+        entry['bringing_plus_one'] = bool(entry['bringing_plus_one'])
+    return entry
+
+
+class OfflineStation:
+    """Keeps a scanner station checking people in while the database is away.
+
+    Scans go to PostgreSQL as usual while it answers within
+    ONLINE_SCAN_TIMEOUT. Once it doesn't, the station switches to offline
+    mode: attendees are looked up in a local SQLite snapshot of the roster
+    and check-ins are appended to a local queue, so a scan never waits on
+    the network. A background thread keeps the snapshot current and replays
+    the queue in batches when the database is reachable again. Replays only
+    ever raise checked_in (GREATEST), so a check-in that is applied twice,
+    or that another station already recorded, changes nothing.
+    """
+
+    def __init__(self, path=OFFLINE_DB_PATH):
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # A scan that was acknowledged must survive a power cut
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='online-scan')
+        self._thread = None
+        self._snapshot_version = None
+        self.online = True
+        self.last_sync = None
+        # Set when a sync fails for any reason other than the database being away
+        self.last_error = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sync_loop, name='offline-sync', daemon=True)
+                self._thread.start()
+
+    def mark_offline(self):
+        self.online = False
+
+    # Local roster snapshot
+
+    def save_snapshot(self, year, entries):
+        """Replace the local copy of a year's roster.
+
+        Check-ins still waiting in the queue are re-applied on top, so a
+        snapshot taken before they were replayed doesn't undo them.
+        """
+        rows = [(year, *(str(e[c]) if c == 'qr_code' else e[c] for c in SNAPSHOT_COLUMNS)) for e in entries]
+        placeholders = ', '.join('?' * (len(SNAPSHOT_COLUMNS) + 1))
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM roster WHERE year = ?", (year,))
+                self._db.executemany(
+                    f"INSERT INTO roster (year, {', '.join(SNAPSHOT_COLUMNS)}) VALUES ({placeholders})",
+                    rows,
+                )
+                self._db.execute("""
+                    UPDATE roster
+                    SET checked_in = MAX(COALESCE(checked_in, 0), (
+                        SELECT MAX(q.checked_in) FROM checkin_queue q
+                        WHERE q.synced_at IS NULL AND q.year = roster.year AND q.qr_code = roster.qr_code
+                    ))
+                    WHERE year = ? AND qr_code IN (
+                        SELECT qr_code FROM checkin_queue WHERE synced_at IS NULL AND year = ?
+                    )
+                """, (year, year))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def entries(self, year=CURRENT_YEAR):
+        """Every roster entry in the local snapshot."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM roster WHERE year = ?", (year,)
+            ).fetchall()
+        return [_entry(row) for row in rows]
+
+    def lookup(self, code, year=CURRENT_YEAR):
+        """Roster entry from the local snapshot, or None."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM roster WHERE year = ? AND qr_code = ?",
+                (year, str(code).strip()),
+            ).fetchone()
+        return _entry(row) if row else None
+
+    # Check-ins
+
+    def run_online(self, fn, *args):
+        """Run fn against the database, waiting at most ONLINE_SCAN_TIMEOUT.
+
+        Anything a scan does on the database goes through here, so a dead
+        network costs a scan at most the timeout. Raises one of
+        CONNECTION_ERRORS, and switches to offline mode, if the database
+        doesn't answer in time.
+        """
+        future = self._executor.submit(fn, *args)
+        try:
+            return future.result(timeout=ONLINE_SCAN_TIMEOUT)
+        except CONNECTION_ERRORS:
+            self.mark_offline()
+            raise
+
+    def check_in(self, code, year=CURRENT_YEAR):
+        """Check an attendee in, through the database if it answers in time.
+
+        Returns the same dict as attendees.check_in_attendee, with 'offline'
+        set to True when the check-in was only recorded locally.
+        """
+        if self.online:
+            try:
+                attendee = self.run_online(check_in_attendee, code, year)
+                if attendee:
+                    attendee['offline'] = False
+                return attendee
+            except CONNECTION_ERRORS:
+                # If the slow attempt does land later, the queued copy
+                # replays as a no-op
+                pass
+        return self._check_in_locally(code, year)
+
+    def _check_in_locally(self, code, year):
+        code = str(code).strip()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM roster WHERE year = ? AND qr_code = ?",
+                    (year, code),
+                ).fetchone()
+                if row is None:
+                    self._db.execute("ROLLBACK")
+                    return None
+                entry = _entry(row)
+                previous = entry['checked_in'] or 0
+                # Same rule as check_in_attendee
+                checked_in = max(previous, 2 if entry['toty'] else 1)
+                self._db.execute(
+                    "UPDATE roster SET checked_in = ? WHERE year = ? AND qr_code = ?",
+                    (checked_in, year, code),
+                )
+                self._db.execute(
+                    "INSERT INTO checkin_queue (year, qr_code, checked_in, scanned_at) VALUES (?, ?, ?, ?)",
+                    (year, code, checked_in, _now()),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return {
+            'name': ' '.join(part for part in (entry['first_name'], entry['last_name']) if part),
+            'school_system': entry['school_system'],
+            'plus_one': entry['bringing_plus_one'],
+            'toty': entry['toty'],
+            'status': entry['status'],
+            'table_number': entry['table_number'],
+            'previous_checked_in': previous,
+            'checked_in': checked_in,
+            'offline': True,
+        }
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM checkin_queue WHERE synced_at IS NULL").fetchone()[0]
+
+    def replay(self, batch_size=SYNC_BATCH_SIZE):
+        """Push queued check-ins to PostgreSQL. Returns how many were sent.
+
+        Each batch is one UPDATE. Queue rows are marked synced only after
+        it commits, so a crash in between just replays the batch again.
+        """
+        sent = 0
+        while True:
+            with self._lock:
+                batch = self._db.execute("""
+                    SELECT id, year, qr_code, checked_in FROM checkin_queue
+                    WHERE synced_at IS NULL ORDER BY id LIMIT ?
+                """, (batch_size,)).fetchall()
+            if not batch:
+                return sent
+            latest = {}
+            for _, year, code, checked_in in batch:
+                key = (year, code)
+                latest[key] = max(latest.get(key, 0), checked_in)
+            values = [(year, code, checked_in) for (year, code), checked_in in latest.items()]
+            with get_connection() as conn, conn.cursor() as cur:
+                execute_values(cur, """
+                    UPDATE attendees a
+                    SET checked_in = GREATEST(COALESCE(a.checked_in, 0), v.checked_in)
+                    FROM (VALUES %s) AS v (year, qr_code, checked_in)
+                    WHERE a.year = v.year AND a.qr_code = v.qr_code
+                      AND COALESCE(a.checked_in, 0) < v.checked_in
+                """, values)
+                # Codes that are sponsor tickets (see the ticket_holders view)
+                execute_values(cur, """
+                    UPDATE sponsor_tickets t
+                    SET checked_in = GREATEST(t.checked_in, v.checked_in)
+                    FROM (VALUES %s) AS v (year, qr_code, checked_in)
+                    WHERE t.year = v.year AND t.ticket_number = v.qr_code
+                      AND t.checked_in < v.checked_in
+                      AND NOT EXISTS (
+                          SELECT 1 FROM attendees a WHERE a.year = t.year AND a.qr_code = t.ticket_number
+                      )
+                """, values)
+                conn.commit()
+            with self._lock:
+                self._db.executemany(
+                    "UPDATE checkin_queue SET synced_at = ? WHERE id = ?",
+                    [(_now(), row[0]) for row in batch],
+                )
+            sent += len(batch)
+
+    # Background sync
+
+    def _sync_loop(self):
+        while True:
+            try:
+                self.replay()
+                roster = get_roster(CURRENT_YEAR)
+                roster.refresh_if_stale()
+                if roster.version != self._snapshot_version:
+                    self._snapshot_version = roster.version
+                    self.save_snapshot(CURRENT_YEAR, roster.entries(refresh=False))
+                self.online = True
+                self.last_sync = time.time()
+                self.last_error = None
+            except CONNECTION_ERRORS:
+                self.online = False
+            except Exception as e:
+                # Not a network problem, so offline mode wouldn't help; keep
+                # the error for the page to show and try again next round
+                self.online = True
+                self.last_error = e
+            time.sleep(SYNC_INTERVAL_SECONDS)
+
+
+_station = None
+_station_lock = threading.Lock()
+
+
+def get_station():
+    """Return the process-wide offline station, starting its sync thread on first use."""
+    global _station
+    if _station is None:
+        with _station_lock:
+            if _station is None:
+                _station = OfflineStation()
+                _station.start()
+    return _station
@@ -1,222 +1,64 @@
 import streamlit as st
 import os
-import psycopg2
 from datetime import datetime
-import random
-import string
-import bcrypt
-import base64
-import requests
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import qrcode
-from io import BytesIO
+import html
+import io
+from psycopg2.extras import execute_values
+from attendees import CURRENT_YEAR
+from auth import (
+    LoginError, authenticate_admin, authenticate_sponsor, hash_password, issue_session_token,
+    verify_session_token,
+)
+from db import get_connection, pool_stats
+from mailer import (
+    get_delivery_status, get_outbox_status, get_outbox_worker, parse_recipients,
+    queue_bulk_ticket_emails, queue_ticket_email, retry_ticket_email, token_cache_stats,
+)
+from migrations import ensure_schema
+from tickets import (
+    BUNDLE_LAYOUTS, EVENT_DETAILS, allocate_ticket_numbers, generate_qr_code_base64,
+    iter_ticket_bundle, prewarm_qr_codes, write_ticket_bundle,
+)
 
 st.set_page_config(page_title="Sponsor Portal", page_icon="🎟️", layout="wide")
 
-def get_gmail_access_token():
-    client_id = os.environ.get('GOOGLE_CLIENT_ID')
-    client_secret = os.environ.get('GOOGLE_CLIENT_SECRET')
-    refresh_token = os.environ.get('GOOGLE_REFRESH_TOKEN')
-    
-    if client_id and client_secret and refresh_token:
-        try:
-            response = requests.post(
-                'https://oauth2.googleapis.com/token',
-                data={
-                    'client_id': client_id,
-                    'client_secret': client_secret,
-                    'refresh_token': refresh_token,
-                    'grant_type': 'refresh_token'
-                }
-            )
-            if response.status_code == 200:
-                return response.json().get('access_token')
-        except Exception as e:
-            st.error(f"Error refreshing token: {e}")
-            return None
-    
-    hostname = os.environ.get('REPLIT_CONNECTORS_HOSTNAME')
-    repl_identity = os.environ.get('REPL_IDENTITY')
-    web_repl_renewal = os.environ.get('WEB_REPL_RENEWAL')
-    
-    if repl_identity:
-        x_replit_token = 'repl ' + repl_identity
-    elif web_repl_renewal:
-        x_replit_token = 'depl ' + web_repl_renewal
-    else:
-        return None
-    
-    try:
-        response = requests.get(
-            f'https://{hostname}/api/v2/connection?include_secrets=true&connector_names=google-mail',
-            headers={
-                'Accept': 'application/json',
-                'X_REPLIT_TOKEN': x_replit_token
-            }
-        )
-        data = response.json()
-        connection = data.get('items', [{}])[0]
-        settings = connection.get('settings', {})
-        access_token = settings.get('access_token') or settings.get('oauth', {}).get('credentials', {}).get('access_token')
-        return access_token
-    except Exception as e:
-        st.error(f"Error getting Gmail access: {e}")
-        return None
+# Both no-ops after the first run in this process
+try:
+    ensure_schema()
+except Exception as e:
+    st.error(f"Database error: {e}")
+get_outbox_worker()
 
-def send_ticket_email(recipient_email, recipient_name, ticket_number, company_name):
-    access_token = get_gmail_access_token()
-    if not access_token:
-        return False, "Gmail not connected"
-    
-    qr_base64 = generate_qr_code_base64(ticket_number)
-    
-    html_content = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background-color: #2c5282; color: white; padding: 20px; text-align: center;">
-            <h1>Teacher Appreciation Dinner</h1>
-            <p>Your Ticket</p>
-        </div>
-        <div style="padding: 20px; border: 1px solid #ddd;">
-            <p>Dear {recipient_name},</p>
-            <p>You have been invited to attend the <strong>Teacher Appreciation Dinner</strong> as a guest of <strong>{company_name}</strong>.</p>
-            
-            <div style="background-color: #f7fafc; border: 2px solid #2c5282; padding: 20px; margin: 20px 0; text-align: center;">
-                <img src="data:image/png;base64,{qr_base64}" alt="QR Code" style="width: 150px; height: 150px;">
-                <h2 style="color: #2c5282; margin: 10px 0; font-size: 32px; letter-spacing: 5px;">{ticket_number}</h2>
-                <p style="color: #666; font-size: 12px;">Scan QR code or provide this number at check-in</p>
-            </div>
-            
-            <h3>Event Details:</h3>
-            <ul>
-                <li><strong>Date:</strong> {EVENT_DETAILS['date']}</li>
-                <li><strong>Venue:</strong> {EVENT_DETAILS['venue']}</li>
-                <li><strong>Address:</strong> {EVENT_DETAILS['address']}</li>
-                <li><strong>Doors Open:</strong> {EVENT_DETAILS['doors_open']}</li>
-                <li><strong>Dinner Served:</strong> {EVENT_DETAILS['dinner_served']}</li>
-                <li><strong>Keynote Speaker:</strong> {EVENT_DETAILS['keynote_speaker']}</li>
-            </ul>
-            
-            <p>Please present this email or your ticket number at check-in.</p>
-            <p>We look forward to seeing you!</p>
-        </div>
-        <div style="background-color: #edf2f7; padding: 10px; text-align: center; font-size: 12px;">
-            <p>Valdosta-North Rotary Teacher Appreciation Dinner</p>
-        </div>
-    </body>
-    </html>
-    """
-    
-    sender_email = os.environ.get('GMAIL_SENDER_EMAIL', 'noreply@example.com')
-    sender_name = os.environ.get('GMAIL_SENDER_NAME', 'Valdosta-North Rotary')
-    
-    message = MIMEMultipart('alternative')
-    message['From'] = f"{sender_name} <{sender_email}>"
-    message['To'] = recipient_email
-    message['Subject'] = f"Your Ticket to the Teacher Appreciation Dinner - {EVENT_DETAILS['date']}"
-    
-    text_part = MIMEText(f"You are invited to the Teacher Appreciation Dinner. Ticket #{ticket_number}. Date: {EVENT_DETAILS['date']}. Venue: {EVENT_DETAILS['venue']}, {EVENT_DETAILS['address']}", 'plain')
-    html_part = MIMEText(html_content, 'html')
-    
-    message.attach(text_part)
-    message.attach(html_part)
-    
-    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
-    
-    try:
-        response = requests.post(
-            'https://gmail.googleapis.com/gmail/v1/users/me/messages/send',
-            headers={
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            },
-            json={'raw': raw_message}
-        )
-        
-        if response.status_code == 200:
-            return True, "Email sent successfully"
-        else:
-            return False, f"Failed to send: {response.text}"
-    except Exception as e:
-        return False, str(e)
-
-CURRENT_YEAR = 2026
-
-EVENT_DETAILS = {
-    "name": "Teacher Appreciation Dinner",
-    "date": "Thursday, February 5th, 2026",
-    "doors_open": "5:30 PM",
-    "dinner_served": "6:00 PM",
-    "end_time": "9:00 PM",
-    "keynote_speaker": "Gerry Brooks",
-    "venue": "Rainwater Conference Center",
-    "address": "1 Meeting Pl, Valdosta, GA 31601"
-}
-
-def generate_ticket_number():
-    return str(random.randint(10000, 99999))
-
-def generate_qr_code_base64(ticket_number):
-    qr = qrcode.QRCode(version=1, box_size=10, border=2)
-    qr.add_data(ticket_number)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    return base64.b64encode(buffer.getvalue()).decode('utf-8')
-
-def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(password, hashed):
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+# How often a bulk send's status panel picks up delivery progress
+BULK_STATUS_REFRESH_SECONDS = 2
 
 def get_sponsor_info(username, password):
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, company_name, sponsor_level, total_seats, year, password
-            FROM sponsors
-            WHERE username = %s AND year = %s
-        """, (username, CURRENT_YEAR))
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        if result:
-            stored_password = result[5]
-            if stored_password.startswith('$2'):
-                if not verify_password(password, stored_password):
-                    return None
-            else:
-                if password != stored_password:
-                    return None
-            return {
-                'id': result[0],
-                'company_name': result[1],
-                'sponsor_level': result[2],
-                'total_seats': result[3],
-                'year': result[4]
-            }
+        return authenticate_sponsor(username, password, CURRENT_YEAR)
+    except LoginError as e:
+        st.error(str(e))
         return None
     except Exception as e:
         st.error(f"Database error: {e}")
         return None
 
+def check_admin_login(username, password):
+    try:
+        return authenticate_admin(username, password, ADMIN_USERNAME, ADMIN_PASSWORD)
+    except LoginError as e:
+        st.error(str(e))
+        return None
+
 def get_sponsor_tickets(sponsor_id):
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, ticket_number, recipient_email, recipient_name, sent_at, printed_at
-            FROM sponsor_tickets
-            WHERE sponsor_id = %s AND year = %s
-            ORDER BY id
-        """, (sponsor_id, CURRENT_YEAR))
-        tickets = cur.fetchall()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, ticket_number, recipient_email, recipient_name, sent_at, printed_at
+                FROM sponsor_tickets
+                WHERE sponsor_id = %s AND year = %s
+                ORDER BY id
+            """, (sponsor_id, CURRENT_YEAR))
+            tickets = cur.fetchall()
         return tickets
     except Exception as e:
         st.error(f"Database error: {e}")
@@ -224,53 +66,32 @@ def get_sponsor_tickets(sponsor_id):
 
 def create_tickets_for_sponsor(sponsor_id, total_seats):
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM sponsor_tickets WHERE sponsor_id = %s AND year = %s", (sponsor_id, CURRENT_YEAR))
-        existing = cur.fetchone()[0]
+        with get_connection() as conn, conn.cursor() as cur:
+            # Serializes concurrent top-ups (say, an admin and the sponsor at once)
+            cur.execute("SELECT id FROM sponsors WHERE id = %s FOR UPDATE", (sponsor_id,))
+            cur.execute("SELECT COUNT(*) FROM sponsor_tickets WHERE sponsor_id = %s AND year = %s", (sponsor_id, CURRENT_YEAR))
+            existing = cur.fetchone()[0]
         
-        if existing < total_seats:
-            for _ in range(total_seats - existing):
-                ticket_number = generate_ticket_number()
-                cur.execute("""
+            if existing < total_seats:
+                created = allocate_ticket_numbers(cur, total_seats - existing, CURRENT_YEAR)
+                execute_values(cur, """
                     INSERT INTO sponsor_tickets (sponsor_id, ticket_number, year)
-                    VALUES (%s, %s, %s)
-                """, (sponsor_id, ticket_number, CURRENT_YEAR))
-            conn.commit()
-        cur.close()
-        conn.close()
+                    VALUES %s
+                """, [(sponsor_id, ticket_number, CURRENT_YEAR) for ticket_number in created])
+                conn.commit()
+                prewarm_qr_codes(created)
     except Exception as e:
         st.error(f"Error creating tickets: {e}")
 
-def update_ticket_email(ticket_id, email, name):
-    try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE sponsor_tickets
-            SET recipient_email = %s, recipient_name = %s, sent_at = %s
-            WHERE id = %s
-        """, (email, name, datetime.now(), ticket_id))
-        conn.commit()
-        cur.close()
-        conn.close()
-        return True
-    except Exception as e:
-        st.error(f"Error updating ticket: {e}")
-        return False
-
 def mark_ticket_printed(ticket_id):
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE sponsor_tickets
-            SET printed_at = %s
-            WHERE id = %s
-        """, (datetime.now(), ticket_id))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                UPDATE sponsor_tickets
+                SET printed_at = %s
+                WHERE id = %s
+            """, (datetime.now(), ticket_id))
+            conn.commit()
         return True
     except Exception as e:
         st.error(f"Error marking ticket as printed: {e}")
@@ -287,8 +108,8 @@ def generate_printable_ticket(ticket_number, recipient_name, company_name):
             <h3 style="margin: 10px 0; font-size: 24px; letter-spacing: 3px;">{ticket_number}</h3>
         </div>
         <hr>
-        <p><strong>Guest:</strong> {recipient_name if recipient_name else '_______________________'}</p>
-        <p><strong>Sponsored by:</strong> {company_name}</p>
+        <p><strong>Guest:</strong> {html.escape(recipient_name) if recipient_name else '_______________________'}</p>
+        <p><strong>Sponsored by:</strong> {html.escape(company_name or '')}</p>
         <hr>
         <p><strong>Date:</strong> {EVENT_DETAILS['date']}</p>
         <p><strong>Venue:</strong> {EVENT_DETAILS['venue']}</p>
@@ -330,8 +151,8 @@ def generate_printable_html_file(ticket_number, recipient_name, company_name):
             <h3 class="ticket-number">{ticket_number}</h3>
         </div>
         <hr>
-        <p><strong>Guest:</strong> {recipient_name if recipient_name else '_______________________'}</p>
-        <p><strong>Sponsored by:</strong> {company_name}</p>
+        <p><strong>Guest:</strong> {html.escape(recipient_name) if recipient_name else '_______________________'}</p>
+        <p><strong>Sponsored by:</strong> {html.escape(company_name or '')}</p>
         <hr>
         <p><strong>Date:</strong> {EVENT_DETAILS['date']}</p>
         <p><strong>Venue:</strong> {EVENT_DETAILS['venue']}</p>
@@ -345,201 +166,221 @@ def generate_printable_html_file(ticket_number, recipient_name, company_name):
 </body>
 </html>"""
 
-def generate_all_tickets_html(tickets, company_name):
-    html_content = """<!DOCTYPE html>
-<html>
-<head>
-    <title>All Tickets</title>
-    <style>
-        body { font-family: Arial, sans-serif; margin: 0; padding: 0; }
-        .ticket { 
-            border: 2px solid #333; 
-            padding: 20px; 
-            max-width: 400px; 
-            margin: 20px auto;
-            page-break-after: always;
-        }
-        .ticket:last-child { page-break-after: avoid; }
-        h2 { text-align: center; color: #2c5282; margin-top: 0; }
-        .qr-section { text-align: center; margin: 15px 0; }
-        .ticket-number { font-size: 24px; letter-spacing: 3px; margin: 10px 0; }
-        .valid-note { text-align: center; font-style: italic; color: #666; }
-        @media print {
-            body { margin: 0; }
-            .ticket { margin: 0 auto; border: 2px solid #333; }
-        }
-    </style>
-</head>
-<body onload="window.print();">
-"""
-    
-    for ticket in tickets:
-        ticket_id, ticket_number, email, name, sent_at, printed_at = ticket
-        qr_base64 = generate_qr_code_base64(ticket_number)
-        html_content += f"""
-    <div class="ticket">
-        <h2>{EVENT_DETAILS['name']}</h2>
-        <hr>
-        <div class="qr-section">
-            <img src="data:image/png;base64,{qr_base64}" alt="QR Code" style="width: 150px; height: 150px;">
-            <h3 class="ticket-number">{ticket_number}</h3>
-        </div>
-        <hr>
-        <p><strong>Guest:</strong> {name if name else '_______________________'}</p>
-        <p><strong>Sponsored by:</strong> {company_name}</p>
-        <hr>
-        <p><strong>Date:</strong> {EVENT_DETAILS['date']}</p>
-        <p><strong>Venue:</strong> {EVENT_DETAILS['venue']}</p>
-        <p><strong>Address:</strong> {EVENT_DETAILS['address']}</p>
-        <p><strong>Doors Open:</strong> {EVENT_DETAILS['doors_open']} | <strong>End Time:</strong> {EVENT_DETAILS['end_time']}</p>
-        <p><strong>Dinner Served:</strong> {EVENT_DETAILS['dinner_served']}</p>
-        <p><strong>Keynote Speaker:</strong> {EVENT_DETAILS['keynote_speaker']}</p>
-        <hr>
-        <p class="valid-note"><strong>This ticket is valid for one adult entry only.</strong></p>
-    </div>
-"""
-    
-    html_content += """
-</body>
-</html>"""
-    return html_content
+def iter_print_tickets(include_attendees):
+    # Server-side cursors, so rows are pulled as the bundle is written
+    with get_connection() as conn:
+        with conn.cursor(name='print_sponsor_tickets') as cur:
+            cur.itersize = 500
+            cur.execute("""
+                SELECT st.ticket_number, st.recipient_name, 'Sponsored by', s.company_name
+                FROM sponsor_tickets st
+                JOIN sponsors s ON st.sponsor_id = s.id
+                WHERE st.year = %s
+                ORDER BY s.company_name, st.id
+            """, (CURRENT_YEAR,))
+            yield from cur
+        if include_attendees:
+            with conn.cursor(name='print_attendee_tickets') as cur:
+                cur.itersize = 500
+                cur.execute("""
+                    SELECT qr_code, concat_ws(' ', first_name, last_name), 'School System', school_system
+                    FROM attendees
+                    WHERE year = %s AND qr_code IS NOT NULL
+                    ORDER BY last_name, first_name
+                """, (CURRENT_YEAR,))
+                yield from cur
 
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'rotaryadmin2026')
 
 def add_sponsor(username, password, company_name, sponsor_level, total_seats):
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO sponsors (username, password, company_name, sponsor_level, total_seats, year)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (username, password, company_name, sponsor_level, total_seats, CURRENT_YEAR))
-        sponsor_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO sponsors (username, password, company_name, sponsor_level, total_seats, year)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (username, hash_password(password), company_name, sponsor_level, total_seats, CURRENT_YEAR))
+            sponsor_id = cur.fetchone()[0]
+            conn.commit()
         return sponsor_id, None
     except Exception as e:
         return None, str(e)
 
 def delete_sponsor(sponsor_id):
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("DELETE FROM sponsor_tickets WHERE sponsor_id = %s AND year = %s", (sponsor_id, CURRENT_YEAR))
-        cur.execute("DELETE FROM sponsors WHERE id = %s AND year = %s", (sponsor_id, CURRENT_YEAR))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM sponsor_tickets WHERE sponsor_id = %s AND year = %s", (sponsor_id, CURRENT_YEAR))
+            cur.execute("DELETE FROM sponsors WHERE id = %s AND year = %s", (sponsor_id, CURRENT_YEAR))
+            conn.commit()
         return True, None
     except Exception as e:
         return False, str(e)
 
 def update_sponsor_password(sponsor_id, new_password):
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("UPDATE sponsors SET password = %s WHERE id = %s AND year = %s", 
-                    (new_password, sponsor_id, CURRENT_YEAR))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE sponsors SET password = %s WHERE id = %s AND year = %s", 
+                        (hash_password(new_password), sponsor_id, CURRENT_YEAR))
+            conn.commit()
         return True, None
     except Exception as e:
         return False, str(e)
 
-def get_sponsor_tickets_admin(sponsor_id):
-    try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, ticket_number, recipient_name, recipient_email, sent_at, printed_at
-            FROM sponsor_tickets
-            WHERE sponsor_id = %s AND year = %s
-            ORDER BY id
-        """, (sponsor_id, CURRENT_YEAR))
-        tickets = cur.fetchall()
-        cur.close()
-        conn.close()
-        return tickets
-    except Exception as e:
-        return []
-
 def update_ticket_admin(ticket_id, recipient_name, recipient_email):
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE sponsor_tickets 
-            SET recipient_name = %s, recipient_email = %s
-            WHERE id = %s
-        """, (recipient_name if recipient_name else None, recipient_email if recipient_email else None, ticket_id))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                UPDATE sponsor_tickets 
+                SET recipient_name = %s, recipient_email = %s
+                WHERE id = %s
+            """, (recipient_name if recipient_name else None, recipient_email if recipient_email else None, ticket_id))
+            conn.commit()
         return True, None
     except Exception as e:
         return False, str(e)
 
 def mark_ticket_printed_admin(ticket_id):
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE sponsor_tickets 
-            SET printed_at = NOW()
-            WHERE id = %s
-        """, (ticket_id,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                UPDATE sponsor_tickets 
+                SET printed_at = NOW()
+                WHERE id = %s
+            """, (ticket_id,))
+            conn.commit()
         return True, None
     except Exception as e:
         return False, str(e)
 
-def get_all_sponsors():
+def load_admin_sponsors(create_missing=True):
+    """Every sponsor for the year with its tickets, in two queries.
+
+    Returns [(sponsor_id, username, company_name, level, seats, tickets)]
+    with tickets as (id, ticket_number, recipient_name, recipient_email,
+    sent_at, printed_at) in ticket order. Sponsors that have no tickets yet
+    get them created first.
+    """
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, username, company_name, sponsor_level, total_seats
-            FROM sponsors
-            WHERE year = %s
-            ORDER BY sponsor_level, company_name
-        """, (CURRENT_YEAR,))
-        sponsors = cur.fetchall()
-        cur.close()
-        conn.close()
-        return sponsors
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, username, company_name, sponsor_level, total_seats
+                FROM sponsors
+                WHERE year = %s
+                ORDER BY sponsor_level, company_name
+            """, (CURRENT_YEAR,))
+            sponsors = cur.fetchall()
+            cur.execute("""
+                SELECT sponsor_id, id, ticket_number, recipient_name, recipient_email, sent_at, printed_at
+                FROM sponsor_tickets
+                WHERE year = %s
+                ORDER BY sponsor_id, id
+            """, (CURRENT_YEAR,))
+            ticket_rows = cur.fetchall()
     except Exception as e:
         st.error(f"Database error: {e}")
         return []
 
-def get_all_tickets_for_sponsor(sponsor_id):
+    tickets_by_sponsor = {}
+    for sponsor_id, *ticket in ticket_rows:
+        tickets_by_sponsor.setdefault(sponsor_id, []).append(tuple(ticket))
+
+    missing = [s for s in sponsors if s[0] not in tickets_by_sponsor]
+    if missing and create_missing:
+        for sponsor_id, _, _, _, seats in missing:
+            create_tickets_for_sponsor(sponsor_id, seats)
+        return load_admin_sponsors(create_missing=False)
+
+    return [(*sponsor, tickets_by_sponsor.get(sponsor[0], [])) for sponsor in sponsors]
+
+def bulk_email_section(sponsor_id, company_name, key):
+    with st.form(f"bulk_email_{key}", clear_on_submit=True):
+        st.caption("One recipient per line: `Name, email` (or paste two columns from a spreadsheet). "
+                   "Or upload a CSV with name and email columns.")
+        pasted = st.text_area("Recipients", key=f"bulk_text_{key}", placeholder="Jane Smith, jane@example.com")
+        uploaded = st.file_uploader("Or upload a CSV", type='csv', key=f"bulk_file_{key}")
+        submit = st.form_submit_button("Email All", type="primary")
+
+    if submit:
+        queue_bulk_submission(sponsor_id, company_name, key, pasted, uploaded)
+
+    # Progress is polled by a fragment, so the page never waits on the worker
+    batch = st.session_state.get(f"bulk_batch_{key}")
+    if batch:
+        st.fragment(bulk_send_status, run_every=None if batch['done'] else BULK_STATUS_REFRESH_SECONDS)(key)
+
+def queue_bulk_submission(sponsor_id, company_name, key, pasted, uploaded):
+    # Each source is parsed on its own so an uploaded CSV's header is still its first line
+    sources = [("Pasted", pasted or "")]
+    if uploaded is not None:
+        try:
+            sources.append((uploaded.name, uploaded.getvalue().decode('utf-8-sig')))
+        except UnicodeDecodeError:
+            st.error(f"{uploaded.name} isn't saved as UTF-8. In Excel, use Save As > "
+                     "\"CSV UTF-8 (Comma delimited)\" and upload it again.")
+            return
+    recipients = []
+    seen = set()
+    for label, text in sources:
+        found, errors = parse_recipients(text, seen)
+        recipients.extend(found)
+        for line_number, line, message in errors:
+            st.warning(f"{label} line {line_number} skipped ({message}): {line}")
+    if not recipients:
+        st.error("No valid recipients to send to")
+        return
+
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT ticket_number, recipient_name, recipient_email, sent_at, printed_at
-            FROM sponsor_tickets
-            WHERE sponsor_id = %s AND year = %s
-            ORDER BY id
-        """, (sponsor_id, CURRENT_YEAR))
-        tickets = cur.fetchall()
-        cur.close()
-        conn.close()
-        return tickets
+        queued, unassigned = queue_bulk_ticket_emails(sponsor_id, company_name, recipients, CURRENT_YEAR)
     except Exception as e:
-        return []
+        st.error(f"Failed to queue emails: {e}")
+        return
+    if unassigned:
+        st.warning(f"Not enough free tickets for {len(unassigned)} recipient(s): "
+                   + ", ".join(f"{name} <{email}>" for name, email in unassigned))
+    if not queued:
+        return
+
+    st.session_state[f"bulk_batch_{key}"] = {'queued': queued, 'done': False}
 
-if 'sponsor_authenticated' not in st.session_state:
-    st.session_state.sponsor_authenticated = False
-if 'sponsor_info' not in st.session_state:
-    st.session_state.sponsor_info = None
-if 'is_admin' not in st.session_state:
-    st.session_state.is_admin = False
+def bulk_send_status(key):
+    batch = st.session_state.get(f"bulk_batch_{key}")
+    if not batch:
+        return
+    queued = batch['queued']
+    try:
+        statuses = get_outbox_status([row[0] for row in queued])
+    except Exception as e:
+        st.error(f"Could not check delivery status: {e}")
+        return
+    done = sum(1 for status, _ in statuses.values() if status in ('sent', 'failed', 'replaced'))
+    st.progress(done / len(queued), text=f"Sent {done} of {len(queued)}")
+
+    results = []
+    for outbox_id, name, email, ticket_number in queued:
+        status, error = statuses.get(outbox_id, ('pending', None))
+        label = {
+            'sent': "Sent",
+            'failed': f"Failed: {error}",
+            'replaced': "Sent to a different recipient instead",
+        }.get(status, "Queued - will keep retrying")
+        results.append({'Ticket': ticket_number, 'Name': name, 'Email': email, 'Result': label})
+    st.dataframe(results, hide_index=True, use_container_width=True)
+
+    if st.button("Dismiss", key=f"bulk_dismiss_{key}"):
+        del st.session_state[f"bulk_batch_{key}"]
+        st.rerun()
+    if done == len(queued) and not batch['done']:
+        # Everything has an outcome; rerun the page so the panel stops polling
+        batch['done'] = True
+        st.rerun()
+
+# Logins are checked once; every rerun after that only verifies the
+# signed session token, which is cheap
+session = verify_session_token(st.session_state.get('session_token'))
+st.session_state.is_admin = bool(session) and session['sub'] == 'admin'
+st.session_state.sponsor_authenticated = bool(session) and session['sub'].startswith('sponsor:')
+st.session_state.sponsor_info = session['data'] if st.session_state.sponsor_authenticated else None
 
 query_params = st.query_params
 url_username = query_params.get("sponsor", None)
@@ -558,8 +399,7 @@ if not st.session_state.sponsor_authenticated and not st.session_state.is_admin:
             if submit:
                 sponsor = get_sponsor_info(url_username, password)
                 if sponsor:
-                    st.session_state.sponsor_authenticated = True
-                    st.session_state.sponsor_info = sponsor
+                    st.session_state.session_token = issue_session_token(f"sponsor:{sponsor['id']}", sponsor)
                     create_tickets_for_sponsor(sponsor['id'], sponsor['total_seats'])
                     st.rerun()
                 else:
@@ -573,14 +413,17 @@ if not st.session_state.sponsor_authenticated and not st.session_state.is_admin:
             submit = st.form_submit_button("Login")
             
             if submit:
-                if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
-                    st.session_state.is_admin = True
-                    st.rerun()
+                if username == ADMIN_USERNAME:
+                    admin = check_admin_login(username, password)
+                    if admin:
+                        st.session_state.session_token = issue_session_token('admin')
+                        st.rerun()
+                    elif admin is not None:
+                        st.error("Invalid username or password")
                 else:
                     sponsor = get_sponsor_info(username, password)
                     if sponsor:
-                        st.session_state.sponsor_authenticated = True
-                        st.session_state.sponsor_info = sponsor
+                        st.session_state.session_token = issue_session_token(f"sponsor:{sponsor['id']}", sponsor)
                         create_tickets_for_sponsor(sponsor['id'], sponsor['total_seats'])
                         st.rerun()
                     else:
@@ -588,13 +431,13 @@ if not st.session_state.sponsor_authenticated and not st.session_state.is_admin:
 
 elif st.session_state.is_admin:
     if st.button("Logout"):
-        st.session_state.is_admin = False
+        st.session_state.pop('session_token', None)
         st.rerun()
     
     st.markdown("---")
     st.header("Admin Dashboard")
     
-    sponsors = get_all_sponsors()
+    sponsors = load_admin_sponsors()
     
     total_sponsors = len(sponsors)
     total_seats = sum(s[4] for s in sponsors)
@@ -605,6 +448,35 @@ elif st.session_state.is_admin:
     with col2:
         st.metric("Total Seats", total_seats)
     
+    with st.expander("Database Connections"):
+        stats = pool_stats()
+        pcol1, pcol2, pcol3, pcol4 = st.columns(4)
+        with pcol1:
+            st.metric("In Use", stats['in_use'])
+        with pcol2:
+            st.metric("Idle", stats['idle'])
+        with pcol3:
+            st.metric("Peak In Use", stats['peak_in_use'])
+        with pcol4:
+            st.metric("Pool Size", f"{stats['min_size']}-{stats['max_size']}")
+        st.caption(f"Checkouts: {stats['checkouts']} | Health checks: {stats['health_checks']} | "
+                   f"Discarded: {stats['discarded']} | Timeouts: {stats['timeouts']}")
+
+    with st.expander("Email Delivery"):
+        tokens = token_cache_stats()
+        worker = get_outbox_worker()
+        ecol1, ecol2, ecol3, ecol4 = st.columns(4)
+        with ecol1:
+            st.metric("Emails Sent", worker.sent)
+        with ecol2:
+            st.metric("Emails Failed", worker.failed)
+        with ecol3:
+            st.metric("Token Cache Hits", tokens['hits'])
+        with ecol4:
+            st.metric("Token Refreshes", tokens['misses'])
+        st.caption(f"Token refresh failures: {tokens['failures']} | "
+                   f"Current token expires in: {tokens['expires_in']}s")
+    
     st.markdown("---")
     st.subheader("Add New Sponsor")
     
@@ -631,23 +503,32 @@ elif st.session_state.is_admin:
                 else:
                     st.error(f"Failed to add sponsor: {error}")
     
+    st.markdown("---")
+    st.subheader("Bulk Email Tickets")
+    if sponsors:
+        bulk_sponsor = st.selectbox(
+            "Sponsor",
+            sponsors,
+            format_func=lambda s: f"{s[2]} ({s[3]})",
+            key="bulk_sponsor",
+        )
+        bulk_email_section(bulk_sponsor[0], bulk_sponsor[2], "admin")
+
     st.markdown("---")
     st.subheader("Export Sponsor Seating CSV")
+    st.caption("Sponsor tickets scan at check-in directly; this export is only needed for other tools.")
     
     if st.button("Generate Sponsor Seating CSV"):
         try:
-            conn = psycopg2.connect(os.environ['DATABASE_URL'])
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT s.username, st.ticket_number
-                FROM sponsor_tickets st
-                JOIN sponsors s ON st.sponsor_id = s.id
-                WHERE st.year = %s
-                ORDER BY s.username, st.id
-            """, (CURRENT_YEAR,))
-            all_tickets = cur.fetchall()
-            cur.close()
-            conn.close()
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT s.username, st.ticket_number
+                    FROM sponsor_tickets st
+                    JOIN sponsors s ON st.sponsor_id = s.id
+                    WHERE st.year = %s
+                    ORDER BY s.username, st.id
+                """, (CURRENT_YEAR,))
+                all_tickets = cur.fetchall()
             
             csv_rows = ["Name,Email,Type,School System,ticket_id,Table"]
             username_counts = {}
@@ -672,6 +553,33 @@ elif st.session_state.is_admin:
         except Exception as e:
             st.error(f"Error: {e}")
     
+    st.markdown("---")
+    st.subheader("Print All Tickets")
+
+    pcol1, pcol2 = st.columns(2)
+    with pcol1:
+        print_layout = st.radio("Layout", list(BUNDLE_LAYOUTS), format_func=BUNDLE_LAYOUTS.get,
+                                horizontal=True, key="admin_print_layout")
+    with pcol2:
+        include_attendees = st.checkbox("Include attendee tickets", key="admin_print_attendees")
+
+    if st.button("Build Print Bundle"):
+        try:
+            # Built in memory: the download button needs the whole file anyway
+            bundle = io.StringIO()
+            count = write_ticket_bundle(bundle, iter_print_tickets(include_attendees), print_layout,
+                                        title="All Tickets")
+            data = bundle.getvalue()
+            st.download_button(
+                label="Download Print Bundle",
+                data=data,
+                file_name=f"all_tickets_{CURRENT_YEAR}.html",
+                mime="text/html",
+            )
+            st.success(f"Bundled {count} tickets!")
+        except Exception as e:
+            st.error(f"Error: {e}")
+
     st.markdown("---")
     st.subheader("All Sponsors")
     
@@ -679,9 +587,8 @@ elif st.session_state.is_admin:
     sponsors_sorted = sorted(sponsors, key=lambda x: (level_order.get(x[3], 99), x[2]))
     
     for sponsor in sponsors_sorted:
-        sponsor_id, username, company_name, level, seats = sponsor
-        tickets = get_all_tickets_for_sponsor(sponsor_id)
-        assigned = sum(1 for t in tickets if t[1] or t[3] or t[4])
+        sponsor_id, username, company_name, level, seats, admin_tickets = sponsor
+        assigned = sum(1 for t in admin_tickets if t[2] or t[4] or t[5])
         
         with st.expander(f"{company_name} ({level}) - {assigned}/{seats} assigned"):
             col1, col2, col3 = st.columns([2, 1, 1])
@@ -712,12 +619,6 @@ elif st.session_state.is_admin:
             st.markdown("---")
             st.write("**Tickets:**")
             
-            admin_tickets = get_sponsor_tickets_admin(sponsor_id)
-            
-            if not admin_tickets:
-                create_tickets_for_sponsor(sponsor_id, seats)
-                admin_tickets = get_sponsor_tickets_admin(sponsor_id)
-            
             for tkt in admin_tickets:
                 tkt_id, ticket_num, tkt_name, tkt_email, sent, printed = tkt
                 
@@ -753,8 +654,7 @@ else:
     sponsor = st.session_state.sponsor_info
     
     if st.button("Logout"):
-        st.session_state.sponsor_authenticated = False
-        st.session_state.sponsor_info = None
+        st.session_state.pop('session_token', None)
         st.rerun()
     
     st.markdown("---")
@@ -778,21 +678,35 @@ else:
     st.subheader("Your Tickets")
     
     tickets = get_sponsor_tickets(sponsor['id'])
+    try:
+        delivery = get_delivery_status(sponsor['id'])
+    except Exception:
+        delivery = {}
     
     assigned_count = sum(1 for t in tickets if t[2] or t[5])
     st.write(f"**Assigned:** {assigned_count} / {sponsor['total_seats']}")
     
     if tickets:
-        all_tickets_html = generate_all_tickets_html(tickets, sponsor['company_name'])
+        layout = st.radio("Print layout", list(BUNDLE_LAYOUTS), format_func=BUNDLE_LAYOUTS.get, horizontal=True)
+        all_tickets_html = ''.join(iter_ticket_bundle(
+            ((t[1], t[3], "Sponsored by", sponsor['company_name']) for t in tickets),
+            layout,
+            title="All Tickets",
+        ))
         st.download_button(
             label="Print All Tickets",
             data=all_tickets_html,
             file_name=f"all_tickets_{sponsor['company_name'].replace(' ', '_')}.html",
             mime="text/html",
-            help="Download and open to print all tickets at once (one per page)",
+            help="Download and open to print all tickets at once",
             type="primary"
         )
     
+    free_count = sum(1 for t in tickets if not t[2] and not t[5])
+    if free_count:
+        with st.expander(f"Email Tickets in Bulk ({free_count} available)"):
+            bulk_email_section(sponsor['id'], sponsor['company_name'], "sponsor")
+
     for ticket in tickets:
         ticket_id, ticket_number, email, name, sent_at, printed_at = ticket
         
@@ -800,7 +714,33 @@ else:
             if email:
                 st.write(f"**Recipient:** {name}")
                 st.write(f"**Email:** {email}")
-                st.write(f"**Sent:** {sent_at}")
+                status, error = delivery.get(ticket_id, (None, None))
+                if sent_at:
+                    st.write(f"**Sent:** {sent_at}")
+                elif status == 'failed':
+                    st.error(f"Email could not be delivered: {error}")
+                    if st.button("Retry Email", key=f"retry_{ticket_id}"):
+                        retry_ticket_email(ticket_id)
+                        st.rerun()
+                    with st.form(f"reassign_{ticket_id}"):
+                        st.caption("Or send it to a different recipient:")
+                        new_name = st.text_input("Recipient Name", value=name or "", key=f"rename_{ticket_id}")
+                        new_email = st.text_input("Recipient Email", value=email, key=f"reemail_{ticket_id}")
+                        if st.form_submit_button("Change Recipient"):
+                            if not new_name or not new_email:
+                                st.error("Please enter recipient name and email")
+                            else:
+                                try:
+                                    if queue_ticket_email(ticket_id, new_email, new_name, ticket_number, sponsor['company_name']):
+                                        st.rerun()
+                                    else:
+                                        st.warning("This ticket's email is already being handled. Refresh the page.")
+                                except Exception as e:
+                                    st.error(f"Failed to queue email: {e}")
+                elif status in ('pending', 'sending'):
+                    st.write("**Sent:** Queued - sending shortly")
+                else:
+                    st.write("**Sent:** Not emailed")
             elif printed_at:
                 st.write(f"**Recipient:** {name if name else 'Not specified'}")
                 st.write(f"**Printed:** {printed_at}")
@@ -817,14 +757,16 @@ else:
                         elif not recipient_email:
                             st.error("Please enter recipient email")
                         else:
-                            success, message = send_ticket_email(recipient_email, recipient_name, ticket_number, sponsor['company_name'])
-                            if success:
-                                update_ticket_email(ticket_id, recipient_email, recipient_name)
-                                st.success(f"Email sent to {recipient_email}! Please have the recipient check their Spam/Junk folder if the email doesn't arrive in their inbox.")
-                                st.balloons()
-                                st.rerun()
-                            else:
-                                st.error(f"Failed to send email: {message}")
+                            try:
+                                # Sent in the background; the page doesn't wait on Gmail
+                                if queue_ticket_email(ticket_id, recipient_email, recipient_name, ticket_number, sponsor['company_name']):
+                                    st.success(f"Email to {recipient_email} is on its way! Please have the recipient check their Spam/Junk folder if the email doesn't arrive in their inbox.")
+                                    st.balloons()
+                                    st.rerun()
+                                else:
+                                    st.warning("This ticket has just been assigned elsewhere. Refresh the page and pick another ticket.")
+                            except Exception as e:
+                                st.error(f"Failed to queue email: {e}")
                 
                 printable_html = generate_printable_html_file(ticket_number, name, sponsor['company_name'])
                 st.download_button(
@@ -0,0 +1,135 @@
+import threading
+import time
+from datetime import timedelta
+
+from db import get_connection
+
+# How often a lookup may trigger an incremental refresh from the database
+REFRESH_INTERVAL_SECONDS = 2
+# Incremental refreshes can't see deletes, so reload everything now and then
+FULL_RELOAD_SECONDS = 300
+# Re-read rows changed shortly before the watermark so that transactions
+# which committed late are not missed. Re-applying a row is harmless.
+WATERMARK_OVERLAP = timedelta(seconds=30)
+
+ROSTER_COLUMNS = [
+    'qr_code', 'first_name', 'last_name', 'school_system', 'school_cleaned',
+    'bringing_plus_one', 'toty', 'status', 'table_number', 'checked_in', 'updated_at',
+]
+
+# Changes to these invalidate anything indexed by name (see fuzzy.py)
+NAME_COLUMNS = ['qr_code', 'first_name', 'last_name', 'school_system', 'school_cleaned']
+
+# Attendees and sponsor tickets alike (migration 9)
+_SELECT = f"SELECT {', '.join(ROSTER_COLUMNS)} FROM ticket_holders WHERE year = %s"
+
+
+class RosterCache:
+    """In-memory copy of one year's ticket holders, keyed by qr_code.
+
+    Lookups are served from memory. At most every REFRESH_INTERVAL_SECONDS a
+    lookup pulls in rows whose updated_at is past the last one seen, and
+    every FULL_RELOAD_SECONDS the whole year is reloaded.
+    """
+
+    def __init__(self, year):
+        self.year = year
+        self._by_code = {}
+        self._watermark = None
+        self._last_refresh = 0
+        self._last_full_load = 0
+        self._lock = threading.Lock()
+        # Bumped on every change, and separately when a name or school changes
+        self.version = 0
+        self.names_version = 0
+
+    def _store(self, rows, by_code):
+        names_changed = False
+        for row in rows:
+            entry = dict(zip(ROSTER_COLUMNS, row))
+            code = str(entry['qr_code'])
+            previous = by_code.get(code)
+            if previous is None or any(previous[c] != entry[c] for c in NAME_COLUMNS):
+                names_changed = True
+            by_code[code] = entry
+            if self._watermark is None or entry['updated_at'] > self._watermark:
+                self._watermark = entry['updated_at']
+        return names_changed
+
+    def load(self):
+        """Replace the cache with a fresh copy of the year's roster."""
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(_SELECT, (self.year,))
+            rows = cur.fetchall()
+        with self._lock:
+            # Build the new map aside so readers never see a half-filled one
+            by_code = {}
+            self._watermark = None
+            self._store(rows, by_code)
+            self._by_code = by_code
+            self.version += 1
+            self.names_version += 1
+            self._last_refresh = self._last_full_load = time.monotonic()
+
+    def refresh(self):
+        """Pull in rows changed since the last load or refresh."""
+        now = time.monotonic()
+        # load() resets the watermark under the lock, so read it under the lock too
+        with self._lock:
+            watermark = self._watermark
+            full = watermark is None or now - self._last_full_load > FULL_RELOAD_SECONDS
+            if not full:
+                # Claim this refresh up front so concurrent lookups don't pile on
+                self._last_refresh = now
+        if full:
+            self.load()
+            return
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(_SELECT + " AND updated_at > %s",
+                        (self.year, watermark - WATERMARK_OVERLAP))
+            rows = cur.fetchall()
+        if rows:
+            with self._lock:
+                if self._store(rows, self._by_code):
+                    self.names_version += 1
+                self.version += 1
+
+    def refresh_if_stale(self):
+        if time.monotonic() - self._last_refresh > REFRESH_INTERVAL_SECONDS:
+            self.refresh()
+
+    def get(self, code, refresh=True):
+        if refresh:
+            self.refresh_if_stale()
+        return self._by_code.get(str(code).strip())
+
+    def update(self, code, **changes):
+        """Apply a change this process just wrote, without waiting for a refresh."""
+        with self._lock:
+            entry = self._by_code.get(str(code).strip())
+            if entry is not None:
+                entry.update(changes)
+                self.version += 1
+
+    def entries(self, refresh=True):
+        """All cached rows. Pass refresh=False to skip the database entirely."""
+        if refresh:
+            self.refresh_if_stale()
+        return list(self._by_code.values())
+
+
+_rosters = {}
+_rosters_lock = threading.Lock()
+
+
+def get_roster(year):
+    """Return the process-wide roster cache for a year, preloading it on first use."""
+    roster = _rosters.get(year)
+    if roster is None:
+        with _rosters_lock:
+            roster = _rosters.get(year)
+            if roster is None:
+                roster = RosterCache(year)
+                roster.load()
+                _rosters[year] = roster
+    return roster
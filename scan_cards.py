@@ -0,0 +1,117 @@
+import html
+import threading
+from functools import lru_cache
+
+from attendees import CURRENT_YEAR, TOTY_LABELS
+from roster import get_roster
+
+_BANNER_STYLE = (
+    "background-color: {background}; color: {color}; padding: 15px; border-radius: 10px; "
+    "text-align: center; font-size: 24px; font-weight: bold; margin-bottom: 15px;"
+)
+_NOTICE_STYLE = "background-color: {background}; color: {color}; padding: 12px 16px; border-radius: 8px; margin-top: 8px;"
+
+# Everything a card shows; a card is rebuilt only when one of these changes
+CARD_FIELDS = ['name', 'school_system', 'status', 'plus_one', 'toty', 'table_number']
+
+
+def attendee_from_entry(entry):
+    """The attendee info shown at the door, from a roster cache entry."""
+    return {
+        'name': ' '.join(part for part in (entry['first_name'], entry['last_name']) if part),
+        'school_system': entry['school_system'],
+        'plus_one': entry['bringing_plus_one'],
+        'checked_in': entry['checked_in'],
+        'toty': entry['toty'],
+        'status': entry['status'],
+        'table_number': entry['table_number'],
+    }
+
+
+@lru_cache(maxsize=None)
+def banner_html(status, table_number):
+    """Seating banner: admin table, sponsor table or open seating."""
+    if status in ['Admin', 'Administration']:
+        background, color, text = '#28a745', 'white', "Admin Table"
+    elif status == 'Sponsor':
+        background, color = '#FFD700', 'black'
+        text = f"Sponsor Table #{table_number}" if table_number else "Sponsor Table"
+    else:
+        background, color, text = '#6c757d', 'white', "General Open Seating"
+    return f'<div style="{_BANNER_STYLE.format(background=background, color=color)}">{text}</div>'
+
+
+def build_card(attendee):
+    """Banner and details for one attendee as a single HTML block."""
+    lines = [
+        banner_html(attendee['status'], attendee['table_number']),
+        f"<p><strong>Name:</strong> {html.escape(attendee['name'])}<br>",
+        f"<strong>School System:</strong> {html.escape(str(attendee['school_system']))}<br>",
+        f"<strong>Type:</strong> {html.escape(str(attendee['status']))}<br>",
+        f"<strong>Bringing Plus One:</strong> {'Yes' if attendee['plus_one'] else 'No'}</p>",
+    ]
+    label = TOTY_LABELS.get(attendee['toty'])
+    if label:
+        lines.append(f'<p style="color: #21c354; font-weight: bold;">{label}</p>')
+    return ''.join(lines)
+
+
+def notice_html(attendee):
+    """Outcome of this particular scan, shown under the card."""
+    if attendee['previous_checked_in'] != 0:
+        background, color, text = '#fff8e1', '#7a5b00', "Already checked in"
+    else:
+        background, color = '#e8f5e9', '#1b5e20'
+        text = f"{html.escape(attendee['name'])} checked in successfully!"
+    if attendee.get('offline'):
+        text += " (saved on this station, will sync when back online)"
+    return f'<div style="{_NOTICE_STYLE.format(background=background, color=color)}">{text}</div>'
+
+
+class ScanCardCache:
+    """Pre-rendered scan cards keyed by qr_code.
+
+    Cards are built for the whole roster whenever it changes, so a scan only
+    has to look one up. A card whose fields no longer match the attendee
+    being shown (say, a seat changed since the roster was read) is rebuilt
+    on the spot.
+    """
+
+    def __init__(self):
+        self._cards = {}
+        self._roster_version = None
+        self._lock = threading.Lock()
+
+    def warm(self, roster):
+        if roster.version == self._roster_version:
+            return
+        with self._lock:
+            if roster.version == self._roster_version:
+                return
+            version = roster.version
+            for entry in roster.entries(refresh=False):
+                self.card(entry['qr_code'], attendee_from_entry(entry))
+            self._roster_version = version
+
+    def card(self, code, attendee):
+        code = str(code).strip()
+        key = tuple(attendee[f] for f in CARD_FIELDS)
+        cached = self._cards.get(code)
+        if cached is None or cached[0] != key:
+            cached = (key, build_card(attendee))
+            self._cards[code] = cached
+        return cached[1]
+
+
+_cards = ScanCardCache()
+
+
+def get_scan_cards(year=CURRENT_YEAR):
+    """The process-wide card cache, warmed from the year's roster."""
+    _cards.warm(get_roster(year))
+    return _cards
+
+
+def scan_card(code, attendee):
+    """Card for one scan, without touching the roster (works offline)."""
+    return _cards.card(code, attendee)
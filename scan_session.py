@@ -0,0 +1,52 @@
+import os
+import time
+from collections import OrderedDict
+
+# A badge read again within this many seconds (say, after another badge in
+# between) gets the earlier result back instead of a second check-in
+SCAN_DEDUP_SECONDS = float(os.environ.get('SCAN_DEDUP_SECONDS', 15))
+
+
+class ScanSession:
+    """Recently processed codes for one scanner station.
+
+    The scanner keeps returning its last value on every rerun, so a value
+    equal to the previous one is never treated as a new scan, however long
+    ago it was read. A code that comes back after a different one is
+    re-processed only once the window has passed. Only successful results
+    are remembered; a failed lookup is retried on the next read.
+    """
+
+    def __init__(self, window=SCAN_DEDUP_SECONDS):
+        self.window = window
+        self._recent = OrderedDict()
+        self._last_value = None
+        self._last_result = None
+        self.repeats = 0
+
+    def _expire(self, now):
+        while self._recent:
+            code, (seen_at, _) = next(iter(self._recent.items()))
+            if now - seen_at < self.window:
+                break
+            del self._recent[code]
+
+    def process(self, code, handler):
+        """Return (result, repeated) for the scanner's current value."""
+        code = str(code).strip()
+        if code == self._last_value:
+            self.repeats += 1
+            return self._last_result, True
+        now = time.monotonic()
+        self._expire(now)
+        if code in self._recent:
+            self.repeats += 1
+            result, repeated = self._recent[code][1], True
+        else:
+            result, repeated = handler(code), False
+            if result is None:
+                return None, False
+            self._recent[code] = (now, result)
+        self._last_value = code
+        self._last_result = result
+        return result, repeated
@@ -0,0 +1,83 @@
+import psycopg2
+
+from attendees import CURRENT_YEAR
+from db import get_connection
+from roster import get_roster
+
+SEARCH_LIMIT = 25
+# Trigram indexes can't narrow down queries shorter than this
+MIN_INDEXED_QUERY_LENGTH = 3
+
+SEARCH_COLUMNS = [
+    'qr_code', 'first_name', 'last_name', 'school_system', 'status',
+    'checked_in', 'toty', 'table_number',
+]
+
+# Must match the expression indexed by migration 2 (the attendees side of ticket_holders)
+_FULL_NAME = "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, ''))"
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_database(query, year=CURRENT_YEAR, limit=SEARCH_LIMIT):
+    """Indexed name search over attendees and sponsor guests (ticket_holders).
+
+    Prefix matches rank ahead of substring matches.
+    """
+    q = _escape_like(query.strip().lower())
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {', '.join(SEARCH_COLUMNS)}
+            FROM ticket_holders
+            WHERE year = %(year)s AND {_FULL_NAME} LIKE %(substring)s
+            ORDER BY
+                CASE WHEN lower(last_name) LIKE %(prefix)s
+                       OR lower(first_name) LIKE %(prefix)s
+                       OR {_FULL_NAME} LIKE %(prefix)s
+                     THEN 0 ELSE 1 END,
+                last_name, first_name
+            LIMIT %(limit)s
+        """, {'year': year, 'substring': f'%{q}%', 'prefix': f'{q}%', 'limit': limit})
+        return [dict(zip(SEARCH_COLUMNS, row)) for row in cur.fetchall()]
+
+
+def _match_rank(entry, q):
+    first = (entry['first_name'] or '').lower()
+    last = (entry['last_name'] or '').lower()
+    full = f"{first} {last}"
+    if first.startswith(q) or last.startswith(q) or full.startswith(q):
+        return 0
+    if q in full:
+        return 1
+    return None
+
+
+def search_roster(entries, query, limit=SEARCH_LIMIT):
+    """Same matching and ranking as search_database, over cached roster rows."""
+    q = query.strip().lower()
+    ranked = []
+    for entry in entries:
+        rank = _match_rank(entry, q)
+        if rank is not None:
+            ranked.append((rank, entry['last_name'] or '', entry['first_name'] or '', entry))
+    ranked.sort(key=lambda r: r[:3])
+    return [{c: entry[c] for c in SEARCH_COLUMNS} for *_, entry in ranked[:limit]]
+
+
+def search_attendees(query, year=CURRENT_YEAR, limit=SEARCH_LIMIT):
+    """Search attendee names for a year.
+
+    Short queries, and any query while the database is unreachable, are
+    answered from the cached roster instead.
+    """
+    if not query or not query.strip():
+        return []
+    roster = get_roster(year)
+    if len(query.strip()) < MIN_INDEXED_QUERY_LENGTH:
+        return search_roster(roster.entries(), query, limit)
+    try:
+        return search_database(query, year, limit)
+    except psycopg2.Error:
+        return search_roster(roster.entries(refresh=False), query, limit)
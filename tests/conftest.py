@@ -0,0 +1,50 @@
+import os
+import sys
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tables emptied between tests; migrations and sequences are left alone
+_TABLES = ['email_outbox', 'sponsor_tickets', 'sponsors', 'attendees']
+
+
+@pytest.fixture(scope='session')
+def database_url(tmp_path_factory):
+    """A throwaway PostgreSQL database for the DB-backed tests.
+
+    Set TEST_DATABASE_URL to use an existing one (it is migrated and its
+    tables are truncated, so never point it at real data). Otherwise a
+    private server is started with pgserver if that is installed, and the
+    tests are skipped if not.
+    """
+    url = os.environ.get('TEST_DATABASE_URL')
+    server = None
+    if not url:
+        pgserver = pytest.importorskip('pgserver', reason="set TEST_DATABASE_URL or install pgserver")
+        server = pgserver.get_server(str(tmp_path_factory.mktemp('pgdata')), cleanup_mode='stop')
+        url = server.get_uri()
+    os.environ['DATABASE_URL'] = url
+    from migrations import migrate
+    try:
+        migrate()
+    except psycopg2.errors.FeatureNotSupported as e:
+        # pg_trgm (migration 2) isn't shipped with every PostgreSQL build
+        if server is not None:
+            server.cleanup()
+        pytest.skip(f"test database can't run the migrations: {e}")
+    yield url
+    if server is not None:
+        server.cleanup()
+
+
+@pytest.fixture
+def db(database_url):
+    """An open connection to a migrated, empty test database."""
+    from db import get_connection
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"TRUNCATE {', '.join(_TABLES)} RESTART IDENTITY CASCADE")
+        conn.commit()
+        yield conn
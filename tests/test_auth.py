@@ -0,0 +1,40 @@
+import base64
+import json
+
+import pytest
+
+import auth
+from auth import _sign, issue_session_token, verify_session_token
+
+
+def test_issued_token_verifies():
+    claims = verify_session_token(issue_session_token('sponsor:7', {'id': 7}))
+    assert claims['sub'] == 'sponsor:7'
+    assert claims['data'] == {'id': 7}
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    monkeypatch.setattr(auth, 'SESSION_TTL_SECONDS', -1)
+    assert verify_session_token(issue_session_token('admin')) is None
+
+
+def _signed(raw):
+    payload = base64.urlsafe_b64encode(raw)
+    return f"{payload.decode('ascii')}.{_sign(payload)}"
+
+
+@pytest.mark.parametrize('token', [
+    None,
+    '',
+    'no-dot',
+    'abc.def',
+    'é.é',
+    'payload.sïgnature',
+    issue_session_token('admin') + 'x',
+    issue_session_token('admin').replace('.', 'ü.', 1),
+    _signed(b'not json'),
+    _signed(json.dumps({'sub': 'admin'}).encode('utf-8')),
+    _signed(b'\xff\xfe'),
+])
+def test_malformed_tokens_are_rejected_without_raising(token):
+    assert verify_session_token(token) is None
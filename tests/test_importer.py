@@ -0,0 +1,94 @@
+import io
+
+import pandas as pd
+
+from importer import bulk_import, prepare_import_frame
+
+HEADER = "Name,Email,Type,School System,ticket_id,Table\n"
+
+
+def _frame(rows=""):
+    return pd.read_csv(io.StringIO(HEADER + rows))
+
+
+def test_prepare_splits_names_and_normalizes_columns():
+    prepared, errors = prepare_import_frame(_frame(
+        " Jane  Smith ,jane@example.com,TOTY,Lowndes County,1001,4\n"
+        "Cher,,Guest,,1002,\n"
+    ))
+    assert errors == []
+    rows = prepared.to_dict('records')
+    assert rows[0]['first_name'] == 'Jane'
+    assert rows[0]['last_name'] == 'Smith'
+    assert rows[0]['qr_code'] == '1001'
+    assert rows[0]['toty'] == 1
+    assert rows[0]['table_number'] == 4
+    assert rows[1]['first_name'] == 'Cher'
+    assert rows[1]['last_name'] == ''
+    assert rows[1]['school_system'] == 'N/A'
+    assert pd.isna(rows[1]['table_number'])
+
+
+def test_prepare_reports_bad_rows_by_csv_line():
+    prepared, errors = prepare_import_frame(_frame(
+        "Jane Smith,,Guest,,1001,\n"
+        ",,Guest,,1002,\n"
+        "Bob Jones,,Guest,,,\n"
+        "Ann Lee,,Guest,,1001,\n"
+    ))
+    assert list(prepared['qr_code']) == ['1001']
+    assert errors == [
+        (3, '', "Name is empty"),
+        (4, 'Bob Jones', "ticket_id is empty"),
+        (5, 'Ann Lee', "ticket_id 1001 appears more than once"),
+    ]
+
+
+def test_prepare_handles_a_header_only_csv():
+    prepared, errors = prepare_import_frame(_frame())
+    assert prepared.empty
+    assert errors == []
+
+
+def test_prepare_handles_an_all_blank_name_column():
+    prepared, errors = prepare_import_frame(_frame(",,Guest,,1001,\n,,Guest,,1002,\n"))
+    assert prepared.empty
+    assert [message for _, _, message in errors] == ["Name is empty", "Name is empty"]
+
+
+def _attendees(db):
+    with db.cursor() as cur:
+        cur.execute("SELECT qr_code, first_name, last_name, table_number, checked_in FROM attendees ORDER BY qr_code")
+        rows = cur.fetchall()
+    db.commit()
+    return rows
+
+
+def test_bulk_import_inserts_then_updates(db):
+    prepared, _ = prepare_import_frame(_frame(
+        "Jane Smith,jane@example.com,School,Lowndes County,1001,4\n"
+        "Bob Jones,,Guest,,1002,\n"
+    ))
+    assert bulk_import(prepared, 2026) == (2, 0)
+
+    with db.cursor() as cur:
+        cur.execute("UPDATE attendees SET checked_in = 1 WHERE qr_code = '1001'")
+    db.commit()
+
+    prepared, _ = prepare_import_frame(_frame(
+        "Jane Doe,jane@example.com,School,Lowndes County,1001,7\n"
+        "Ann Lee,,Guest,,1003,\n"
+    ))
+    assert bulk_import(prepared, 2026) == (1, 1)
+    # A re-import updates details but leaves check-ins alone
+    assert _attendees(db) == [
+        ('1001', 'Jane', 'Doe', 7, 1),
+        ('1002', 'Bob', 'Jones', None, 0),
+        ('1003', 'Ann', 'Lee', None, 0),
+    ]
+
+
+def test_bulk_import_of_nothing_is_a_no_op(db):
+    prepared, _ = prepare_import_frame(_frame())
+    assert bulk_import(prepared, 2026) == (0, 0)
+    assert _attendees(db) == []
@@ -0,0 +1,124 @@
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import mailer
+from mailer import queue_ticket_email, retry_ticket_email
+
+
+@pytest.fixture
+def ticket_id(db, monkeypatch):
+    # Nothing is sent during these tests
+    monkeypatch.setattr(mailer, 'get_outbox_worker', lambda: types.SimpleNamespace(wake=lambda: None))
+    with db.cursor() as cur:
+        cur.execute("INSERT INTO sponsors (username, password, company_name, year) "
+                    "VALUES ('acme', 'x', 'Acme', 2026) RETURNING id")
+        sponsor_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO sponsor_tickets (sponsor_id, ticket_number, year) "
+                    "VALUES (%s, '12345', 2026) RETURNING id", (sponsor_id,))
+        ticket_id = cur.fetchone()[0]
+    db.commit()
+    return ticket_id
+
+
+def _outbox(db, ticket_id):
+    with db.cursor() as cur:
+        cur.execute("SELECT recipient_email, status FROM email_outbox WHERE ticket_id = %s ORDER BY id",
+                    (ticket_id,))
+        rows = cur.fetchall()
+    db.commit()
+    return rows
+
+
+def _fail(db, ticket_id):
+    with db.cursor() as cur:
+        cur.execute("UPDATE email_outbox SET status = 'failed' WHERE ticket_id = %s", (ticket_id,))
+    db.commit()
+
+
+def test_queue_assigns_a_free_ticket_once(db, ticket_id):
+    assert queue_ticket_email(ticket_id, 'jane@example.com', 'Jane', '12345', 'Acme')
+    assert not queue_ticket_email(ticket_id, 'bob@example.com', 'Bob', '12345', 'Acme')
+    assert _outbox(db, ticket_id) == [('jane@example.com', 'pending')]
+
+
+def test_queue_refuses_a_printed_ticket(db, ticket_id):
+    with db.cursor() as cur:
+        cur.execute("UPDATE sponsor_tickets SET printed_at = now() WHERE id = %s", (ticket_id,))
+    db.commit()
+    assert not queue_ticket_email(ticket_id, 'jane@example.com', 'Jane', '12345', 'Acme')
+    assert _outbox(db, ticket_id) == []
+
+
+def test_failed_ticket_can_be_reassigned(db, ticket_id):
+    assert queue_ticket_email(ticket_id, 'jane@exmaple.com', 'Jane', '12345', 'Acme')
+    _fail(db, ticket_id)
+
+    assert queue_ticket_email(ticket_id, 'jane@example.com', 'Jane', '12345', 'Acme')
+    assert _outbox(db, ticket_id) == [('jane@exmaple.com', 'replaced'), ('jane@example.com', 'pending')]
+    with db.cursor() as cur:
+        cur.execute("SELECT recipient_email FROM sponsor_tickets WHERE id = %s", (ticket_id,))
+        assert cur.fetchone()[0] == 'jane@example.com'
+    db.commit()
+
+    # The replaced email can't be retried to the old address
+    retry_ticket_email(ticket_id)
+    assert _outbox(db, ticket_id) == [('jane@exmaple.com', 'replaced'), ('jane@example.com', 'pending')]
+
+
+def test_retry_requeues_a_failed_email(db, ticket_id):
+    assert queue_ticket_email(ticket_id, 'jane@example.com', 'Jane', '12345', 'Acme')
+    _fail(db, ticket_id)
+    retry_ticket_email(ticket_id)
+    assert _outbox(db, ticket_id) == [('jane@example.com', 'pending')]
+
+
+def test_parse_recipients_formats_and_headers():
+    recipients, errors = mailer.parse_recipients(
+        "\n"
+        "name,email\n"
+        "Jane Smith, jane@example.com\n"
+        "Bob Jones\tbob@example.com\n"
+        '"Ann Lee" <ann@example.com>\n'
+    )
+    assert recipients == [
+        ('Jane Smith', 'jane@example.com'),
+        ('Bob Jones', 'bob@example.com'),
+        ('Ann Lee', 'ann@example.com'),
+    ]
+    assert errors == []
+
+
+def test_parse_recipients_explains_bad_lines():
+    seen = {'dup@example.com'}
+    recipients, errors = mailer.parse_recipients(
+        "Jane Smith\n"
+        "jane@example.com\n"
+        "Bob Jones, bob@\n"
+        "Dup, DUP@example.com\n",
+        seen,
+    )
+    assert recipients == []
+    assert [message for _, _, message in errors] == [
+        "Email is missing or invalid",
+        "Name is missing",
+        "Not a valid email address",
+        "Email listed more than once",
+    ]
+
+
+@pytest.mark.parametrize('expires_at', [
+    lambda t: t.isoformat().replace('+00:00', 'Z'),
+    lambda t: t.timestamp(),
+    lambda t: int(t.timestamp() * 1000),
+])
+def test_connector_expiry_becomes_a_lifetime(expires_at):
+    expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+    lifetime = mailer._seconds_until(expires_at(expiry))
+    assert 3600 - mailer.EXPIRY_CLOCK_SKEW - 5 < lifetime <= 3600 - mailer.EXPIRY_CLOCK_SKEW
+
+
+def test_unreadable_connector_expiry_is_ignored():
+    assert mailer._seconds_until(None) is None
+    assert mailer._seconds_until('soon') is None
@@ -0,0 +1,38 @@
+import tickets
+from tickets import TICKET_NUMBER_MIN, TICKET_NUMBER_RANGE, allocate_ticket_numbers, ticket_block_html
+
+
+def test_allocate_ticket_numbers_returns_distinct_five_digit_numbers(db):
+    with db.cursor() as cur:
+        numbers = allocate_ticket_numbers(cur, 50, 2026)
+    assert len(numbers) == 50
+    assert len(set(numbers)) == 50
+    assert all(TICKET_NUMBER_MIN <= int(n) < TICKET_NUMBER_MIN + TICKET_NUMBER_RANGE for n in numbers)
+
+
+def test_allocate_ticket_numbers_skips_numbers_in_use(db):
+    with db.cursor() as cur:
+        # Find out what the sequence hands out next, then put it back
+        cur.execute("SELECT last_value, is_called FROM ticket_number_seq")
+        last_value, is_called = cur.fetchone()
+        upcoming = allocate_ticket_numbers(cur, 3, 2026)
+        cur.execute("SELECT setval('ticket_number_seq', %s, %s)", (last_value, is_called))
+
+        cur.execute("INSERT INTO attendees (first_name, qr_code, year) VALUES ('Taken', %s, 2026)", (upcoming[0],))
+        cur.execute("INSERT INTO sponsors (username, password, year) VALUES ('s', 'x', 2026) RETURNING id")
+        sponsor_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO sponsor_tickets (sponsor_id, ticket_number, year) VALUES (%s, %s, 2026)",
+                    (sponsor_id, upcoming[1]))
+
+        numbers = allocate_ticket_numbers(cur, 3, 2026)
+    assert upcoming[0] not in numbers
+    assert upcoming[1] not in numbers
+    assert upcoming[2] in numbers
+
+
+def test_ticket_block_escapes_sponsor_entered_text(tmp_path, monkeypatch):
+    monkeypatch.setattr(tickets._qr_cache, 'directory', str(tmp_path))
+    block = ticket_block_html('12345', '<script>alert(1)</script>', "Sponsored by", 'Smith & "Sons"')
+    assert '<script>' not in block
+    assert '&lt;script&gt;alert(1)&lt;/script&gt;' in block
+    assert 'Smith &amp; &quot;Sons&quot;' in block
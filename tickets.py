@@ -0,0 +1,291 @@
+import base64
+import hashlib
+import html
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import qrcode
+
+EVENT_DETAILS = {
+    "name": "Teacher Appreciation Dinner",
+    "date": "Thursday, February 5th, 2026",
+    "doors_open": "5:30 PM",
+    "dinner_served": "6:00 PM",
+    "end_time": "9:00 PM",
+    "keynote_speaker": "Gerry Brooks",
+    "venue": "Rainwater Conference Center",
+    "address": "1 Meeting Pl, Valdosta, GA 31601"
+}
+
+# Pixels per QR module; the default is what tickets and emails have always used
+QR_BOX_SIZE = 10
+QR_BORDER = 2
+# Rendered codes kept in memory, as base64 ready to embed
+QR_MEMORY_CACHE_SIZE = 2048
+QR_CACHE_DIR = os.environ.get('QR_CACHE_DIR', '.qr_cache')
+# Bump when the rendering changes so old PNGs on disk are not reused
+QR_RENDER_VERSION = 1
+
+# Ticket numbers are five digits. Successive values of ticket_number_seq
+# (migration 8) are scattered over that range by an affine permutation:
+# the multiplier is coprime to the range size, so no two sequence values
+# map to the same number and consecutive tickets don't look consecutive.
+TICKET_NUMBER_MIN = 10000
+TICKET_NUMBER_RANGE = 90000
+TICKET_NUMBER_MULTIPLIER = 48271
+TICKET_NUMBER_OFFSET = 7919
+
+
+def allocate_ticket_numbers(cur, count, year):
+    """Reserve count ticket numbers not used by any attendee or sponsor ticket.
+
+    Runs on the caller's cursor so the numbers can be inserted in the same
+    transaction. The sequence never hands out a value twice until it wraps,
+    so concurrent allocations can't collide; numbers that older, randomly
+    chosen tickets already use are skipped.
+    """
+    numbers = []
+    drawn = 0
+    while len(numbers) < count:
+        if drawn >= TICKET_NUMBER_RANGE:
+            raise RuntimeError(f"No free ticket numbers left for {year}")
+        # Ask for a few spare in case some are taken
+        want = count - len(numbers) + 5
+        drawn += want
+        # %% is a literal modulo: the query also has named parameters
+        cur.execute(f"""
+            WITH candidates AS (
+                SELECT ({TICKET_NUMBER_MIN} + (nextval('ticket_number_seq') * {TICKET_NUMBER_MULTIPLIER}
+                        + {TICKET_NUMBER_OFFSET}) %% {TICKET_NUMBER_RANGE})::text AS ticket_number
+                FROM generate_series(1, %(want)s)
+            )
+            SELECT ticket_number FROM candidates c
+            WHERE NOT EXISTS (
+                SELECT 1 FROM sponsor_tickets t WHERE t.year = %(year)s AND t.ticket_number = c.ticket_number
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM attendees a WHERE a.year = %(year)s AND a.qr_code = c.ticket_number
+            )
+        """, {'want': want, 'year': year})
+        numbers.extend(row[0] for row in cur.fetchall())
+    return numbers[:count]
+
+
+def _render_qr_png(ticket_number, size):
+    qr = qrcode.QRCode(version=1, box_size=size, border=QR_BORDER)
+    qr.add_data(ticket_number)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QRCodeCache:
+    """Rendered ticket QR codes keyed by (ticket_number, size).
+
+    Recently used codes are kept in an in-memory LRU. Behind it is a disk
+    store addressed by a hash of everything that determines the image, so
+    codes survive restarts and are shared by every process on the machine.
+    Only a miss in both renders the code.
+    """
+
+    def __init__(self, directory=QR_CACHE_DIR, capacity=QR_MEMORY_CACHE_SIZE):
+        self.directory = directory
+        self.capacity = capacity
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+
+    def _path(self, ticket_number, size):
+        digest = hashlib.sha256(f"{QR_RENDER_VERSION}:{size}:{QR_BORDER}:{ticket_number}".encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.png")
+
+    def _read_disk(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, path, png):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write aside and rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+        except OSError:
+            # The disk store is only an optimization
+            pass
+
+    def get_base64(self, ticket_number, size=QR_BOX_SIZE):
+        key = (str(ticket_number), size)
+        with self._lock:
+            encoded = self._memory.get(key)
+            if encoded is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return encoded
+
+        path = self._path(*key)
+        png = self._read_disk(path)
+        if png is None:
+            png = _render_qr_png(*key)
+            self._write_disk(path, png)
+            self.renders += 1
+        else:
+            self.disk_hits += 1
+        encoded = base64.b64encode(png).decode('utf-8')
+
+        with self._lock:
+            self._memory[key] = encoded
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.capacity:
+                self._memory.popitem(last=False)
+        return encoded
+
+
+_qr_cache = QRCodeCache()
+# Pre-warming runs in the background so creating tickets doesn't wait on it
+_prewarm_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='qr-prewarm')
+
+
+def generate_qr_code_base64(ticket_number, size=QR_BOX_SIZE):
+    return _qr_cache.get_base64(ticket_number, size)
+
+
+def prewarm_qr_codes(ticket_numbers, size=QR_BOX_SIZE):
+    """Render QR codes for new tickets ahead of their first display."""
+    for ticket_number in ticket_numbers:
+        _prewarm_executor.submit(_qr_cache.get_base64, ticket_number, size)
+
+
+
+# One stylesheet for the whole bundle instead of inline styles per ticket
+BUNDLE_STYLESHEET = """
+body { font-family: Arial, sans-serif; margin: 0; padding: 0; }
+.ticket { border: 2px solid #333; padding: 20px; max-width: 400px; margin: 20px auto; }
+.ticket h2 { text-align: center; color: #2c5282; margin-top: 0; }
+.qr-section { text-align: center; margin: 15px 0; }
+.qr-section img { width: 150px; height: 150px; }
+.ticket-number { font-size: 24px; letter-spacing: 3px; margin: 10px 0; }
+.valid-note { text-align: center; font-style: italic; color: #666; }
+.single .ticket { page-break-after: always; }
+.single .ticket:last-child { page-break-after: avoid; }
+.compact .page { display: grid; grid-template-columns: 1fr 1fr; gap: 8px; page-break-after: always; }
+.compact .page:last-child { page-break-after: avoid; }
+.compact .ticket { margin: 0; padding: 10px; max-width: none; font-size: 11px; }
+.compact .ticket h2 { font-size: 14px; }
+.compact .ticket p { margin: 3px 0; }
+.compact .qr-section { margin: 6px 0; }
+.compact .qr-section img { width: 100px; height: 100px; }
+.compact .ticket-number { font-size: 16px; }
+@media print { body { margin: 0; } }
+"""
+BUNDLE_LAYOUTS = {'single': "One ticket per page", 'compact': "Six tickets per page"}
+_EVENT_HTML = {key: html.escape(value) for key, value in EVENT_DETAILS.items()}
+COMPACT_TICKETS_PER_PAGE = 6
+BUNDLE_CHUNK_SIZE = 24
+BUNDLE_WORKERS = 4
+
+
+def ticket_block_html(ticket_number, guest_name, detail_label, detail):
+    """One ticket for a print bundle; styling comes from BUNDLE_STYLESHEET.
+
+    Every value is escaped: names and company names are typed in by sponsors.
+    """
+    qr_base64 = generate_qr_code_base64(ticket_number)
+    event = _EVENT_HTML
+    guest = html.escape(str(guest_name)) if guest_name else '_______________________'
+    return f"""
+    <div class="ticket">
+        <h2>{event['name']}</h2>
+        <hr>
+        <div class="qr-section">
+            <img src="data:image/png;base64,{qr_base64}" alt="QR Code">
+            <h3 class="ticket-number">{html.escape(str(ticket_number))}</h3>
+        </div>
+        <hr>
+        <p><strong>Guest:</strong> {guest}</p>
+        <p><strong>{html.escape(str(detail_label))}:</strong> {html.escape(str(detail or ''))}</p>
+        <hr>
+        <p><strong>Date:</strong> {event['date']}</p>
+        <p><strong>Venue:</strong> {event['venue']}</p>
+        <p><strong>Address:</strong> {event['address']}</p>
+        <p><strong>Doors Open:</strong> {event['doors_open']} | <strong>End Time:</strong> {event['end_time']}</p>
+        <p><strong>Dinner Served:</strong> {event['dinner_served']}</p>
+        <p><strong>Keynote Speaker:</strong> {event['keynote_speaker']}</p>
+        <hr>
+        <p class="valid-note"><strong>This ticket is valid for one adult entry only.</strong></p>
+    </div>
+"""
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_ticket_bundle(tickets, layout='single', title="Tickets"):
+    """Yield a printable HTML bundle piece by piece.
+
+    tickets is any iterable of (ticket_number, guest_name, detail_label,
+    detail) and is consumed lazily, so it can come straight from a
+    server-side cursor. Each chunk of tickets is rendered by a small thread
+    pool and yielded in order; nothing holds the whole bundle in memory.
+    """
+    per_chunk = BUNDLE_CHUNK_SIZE
+    if layout == 'compact':
+        # Keep pages whole within a chunk
+        per_chunk -= per_chunk % COMPACT_TICKETS_PER_PAGE
+
+    yield f"""<!DOCTYPE html>
+<html>
+<head>
+    <title>{html.escape(title)}</title>
+    <style>{BUNDLE_STYLESHEET}</style>
+</head>
+<body class="{layout}" onload="window.print();">
+"""
+    with ThreadPoolExecutor(max_workers=BUNDLE_WORKERS, thread_name_prefix='ticket-bundle') as executor:
+        for chunk in _chunks(tickets, per_chunk):
+            blocks = list(executor.map(lambda t: ticket_block_html(*t), chunk))
+            if layout == 'compact':
+                yield ''.join(
+                    '<div class="page">' + ''.join(page) + '</div>'
+                    for page in _chunks(blocks, COMPACT_TICKETS_PER_PAGE)
+                )
+            else:
+                yield ''.join(blocks)
+    yield """
+</body>
+</html>"""
+
+
+def write_ticket_bundle(fileobj, tickets, layout='single', title="Tickets"):
+    """Write a bundle into a text file object piece by piece. Returns the number of tickets."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for ticket in tickets:
+            count += 1
+            yield ticket
+
+    for piece in iter_ticket_bundle(counted(), layout, title):
+        fileobj.write(piece)
+    return count
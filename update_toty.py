@@ -1,17 +1,16 @@
 
 import os
 import psycopg2
+from migrations import ensure_schema
 
+conn = cur = None
 try:
+    # The toty column itself comes from the baseline migration
+    ensure_schema()
+
     conn = psycopg2.connect(os.environ['DATABASE_URL'])
     cur = conn.cursor()
     
-    # Add toty column
-    cur.execute("""
-        ALTER TABLE attendees 
-        ADD COLUMN IF NOT EXISTS toty INTEGER DEFAULT 0;
-    """)
-    
     # Update toty values for rows where plus_one is true
     cur.execute("""
         UPDATE attendees 
@@ -27,7 +26,7 @@ try:
     """)
     
     conn.commit()
-    print("Successfully added and updated toty column and superintendent values")
+    print("Successfully updated toty and superintendent values")
     
 except Exception as e:
     print(f"Error: {e}")